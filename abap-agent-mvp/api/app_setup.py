@@ -0,0 +1,92 @@
+"""
+Shared App Setup
+Middleware stack and operational routes (metrics, profiling, templates)
+used by every backend app
+"""
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
+from typing import Any
+import asyncio
+import json
+
+from config import settings
+from compression import CompressionMiddleware
+from disconnect import ClientDisconnected, client_disconnected_handler
+from http_cache import etag_matches, strong_etag
+from load_shedding import LoadSheddingMiddleware, LoopLagMonitor
+from metrics import registry
+from profiling import ProfilingMiddleware, require_admin, sample_stacks
+from spec_validation import templates_catalog
+
+router = APIRouter()
+
+
+def install_middlewares(app: FastAPI, lag_monitor: LoopLagMonitor, **cors_options: Any) -> None:
+    """
+    Add the middleware stack shared by all apps; `cors_options` are passed to
+    CORSMiddleware. Also maps client disconnects to an empty 499.
+    """
+    app.add_exception_handler(ClientDisconnected, client_disconnected_handler)
+
+    # Shed uploads first when the process is overloaded
+    # (added before CORS so rejections still carry CORS headers)
+    if settings.load_shedding_enabled:
+        app.add_middleware(
+            LoadSheddingMiddleware,
+            monitor=lag_monitor,
+            lag_threshold=settings.loop_lag_threshold,
+            max_in_flight=settings.max_in_flight_requests,
+            retry_after=settings.load_shedding_retry_after,
+        )
+
+    app.add_middleware(CORSMiddleware, **cors_options)
+
+    # Per-request stage timings, only when an admin token is configured
+    if settings.admin_token:
+        app.add_middleware(ProfilingMiddleware)
+
+    # Compress large text responses; streamed responses pass through unchanged
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Process metrics in Prometheus text format"""
+    return registry.render()
+
+
+@router.post(
+    "/api/admin/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_admin)],
+)
+async def profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """
+    Run the sampling profiler for `seconds` and return collapsed stacks
+    (flamegraph.pl / speedscope input). Requires X-Admin-Token.
+    """
+    seconds = min(max(seconds, 0.1), settings.profile_max_seconds)
+    try:
+        return await asyncio.to_thread(sample_stacks, seconds, max(interval_ms, 1.0) / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/api/templates")
+async def get_templates(request: Request):
+    """Compiled RICEF spec validators used to pre-check uploads"""
+    body = json.dumps(templates_catalog()).encode("utf-8")
+    etag = strong_etag(body)
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.templates_cache_seconds}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+    return Response(content=body, media_type="application/json", headers=cache_headers)
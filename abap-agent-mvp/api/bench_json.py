@@ -0,0 +1,85 @@
+"""
+Benchmark for JSON spec formatting
+Compares the previous json.loads + json.dumps(indent=2) path with the
+in-memory (orjson) and token-stream formatters, and with
+extract_text_from_json, which picks between them by size.
+Sizes: 10 KB, 1 MB and 10 MB
+
+Usage: python bench_json.py
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import _format_json_stream, _format_json_tree, extract_text_from_json, orjson
+
+
+def legacy_extract(file_content: bytes) -> str:
+    """The formatting path used before the fast JSON pipeline"""
+    try:
+        data = json.loads(file_content)
+        return json.dumps(data, indent=2)
+    except Exception:
+        return file_content.decode('utf-8', errors='ignore')
+
+
+def build_spec(target_size: int) -> bytes:
+    """Report spec padded with output fields until it reaches target_size bytes"""
+    field = {
+        "field_name": "MATNR",
+        "description": "Material Number (Größe/Maße)",
+        "data_element": "MATNR",
+        "key": True,
+        "length": 40,
+    }
+    field_size = len(json.dumps(field)) + 2
+    spec = {
+        "ricef_type": "Report",
+        "project_name": "Benchmark",
+        "report_details": {
+            "report_name": "ZBENCH",
+            "output_fields": [field] * max(1, target_size // field_size),
+        },
+    }
+    return json.dumps(spec).encode("utf-8")
+
+
+def measure(func, payload: bytes, repeat: int):
+    """Best wall time and peak traced memory of func(payload)"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(payload)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    func(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    print(f"orjson available: {orjson is not None}")
+    print(f"{'size':>8} | {'path':<8} | {'time (ms)':>10} | {'peak mem (MB)':>13}")
+    print("-" * 50)
+    for label, size, repeat in [("10 KB", 10 * 1024, 50), ("1 MB", 1024 * 1024, 5), ("10 MB", 10 * 1024 * 1024, 2)]:
+        payload = build_spec(size)
+        paths = [
+            ("legacy", legacy_extract),
+            ("tree", _format_json_tree),
+            ("stream", _format_json_stream),
+            ("auto", extract_text_from_json),
+        ]
+        for name, func in paths:
+            seconds, peak = measure(func, payload, repeat)
+            print(f"{label:>8} | {name:<8} | {seconds * 1000:>10.2f} | {peak / 1024 / 1024:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Circuit Breaker
+Stops calling an upstream that keeps failing or responding too slowly
+"""
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Any, Tuple
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(
+            f"Circuit '{name}' is open, retry after {math.ceil(retry_after)} seconds"
+        )
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    While closed, outcomes of the last `window_size` calls are kept. Once at
+    least `min_calls` have been seen, the circuit opens when the failure rate
+    or the slow-call rate reaches its threshold. After `open_seconds` the
+    circuit goes half-open and lets `half_open_max_calls` trial calls through:
+    a success closes it again, a failure re-opens it.
+
+    Background health probes stay out of the window: `probe_failures_to_open`
+    consecutive failed probes open the circuit, and a successful probe closes
+    a half-open one.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 60.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        probe_failures_to_open: int = 3,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.probe_failures_to_open = probe_failures_to_open
+
+        # (succeeded, latency_seconds) for the most recent calls
+        self._window: Deque[Tuple[bool, float]] = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._probe_failures = 0
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the cool-down expires"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit will accept a trial call"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def before_call(self) -> None:
+        """
+        Reserve a call slot.
+        Raises CircuitOpenError if the call must not reach the upstream.
+        """
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError(self.name, self.retry_after())
+        if state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._half_open_calls += 1
+
+    def record_success(self, latency: float) -> None:
+        """Record a completed call"""
+        state = self.state
+        if state == self.OPEN:
+            return
+        if state == self.HALF_OPEN:
+            if latency >= self.slow_call_seconds:
+                self._trip()
+            else:
+                self._close()
+            return
+        self._window.append((True, latency))
+        self._evaluate()
+
+    def record_failure(self, latency: float = 0.0) -> None:
+        """Record a failed call"""
+        state = self.state
+        if state == self.OPEN:
+            return
+        if state == self.HALF_OPEN:
+            self._trip()
+            return
+        self._window.append((False, latency))
+        self._evaluate()
+
+    def record_probe(self, reachable: bool) -> None:
+        """Record a background health probe"""
+        if reachable:
+            self._probe_failures = 0
+            if self.state == self.HALF_OPEN:
+                self._close()
+            return
+        self._probe_failures += 1
+        if self._probe_failures >= self.probe_failures_to_open and self.state != self.OPEN:
+            self._trip()
+
+    def release(self) -> None:
+        """Give back a half-open slot for a call that never reached an outcome"""
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def latency_percentile(self, percentile: float) -> float:
+        """Latency percentile (0-100) over the successful calls in the window"""
+        latencies = sorted(latency for ok, latency in self._window if ok)
+        if not latencies:
+            return 0.0
+        index = min(len(latencies) - 1, math.ceil(percentile / 100 * len(latencies)) - 1)
+        return latencies[max(0, index)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Serializable view of the breaker for health endpoints"""
+        calls = len(self._window)
+        failures = sum(1 for ok, _ in self._window if not ok)
+        slow = sum(1 for _, latency in self._window if latency >= self.slow_call_seconds)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(slow / calls, 3) if calls else 0.0,
+            "retry_after": math.ceil(self.retry_after()),
+        }
+
+    def _evaluate(self) -> None:
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for ok, _ in self._window if not ok)
+        slow = sum(1 for _, latency in self._window if latency >= self.slow_call_seconds)
+        if (
+            failures / calls >= self.failure_rate_threshold
+            or slow / calls >= self.slow_call_rate_threshold
+        ):
+            self._trip()
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self._window.clear()
+
+    def _close(self) -> None:
+        self._state = self.CLOSED
+        self._half_open_calls = 0
+        self._window.clear()
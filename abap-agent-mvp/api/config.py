@@ -27,12 +27,94 @@ class Settings(BaseSettings):
     cors_origins: str = "http://localhost:5173,http://localhost:3000"
 
     # Application Settings
+    debug: bool = False  # verbose logging and raw upstream payloads in responses
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     allowed_file_types: list = [".json", ".txt", ".xlsx"]
 
+    # Response Compression
+    compression_min_size: int = 1024  # bytes - smaller bodies are sent as-is
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+
+    # JSON Spec Parsing
+    json_stream_threshold: int = 5 * 1024 * 1024  # bytes - larger specs skip the object tree
+    json_max_depth: int = 64
+    json_max_output_size: int = 40 * 1024 * 1024  # 40MB of formatted text
+
+    # Load Shedding
+    load_shedding_enabled: bool = True
+    loop_lag_sample_interval: float = 0.5  # seconds between lag samples
+    loop_lag_threshold: float = 0.25  # seconds of smoothed lag before uploads are shed
+    max_in_flight_requests: int = 64  # uploads are shed above this many open requests
+    load_shedding_retry_after: int = 5  # seconds
+
+    # Client Disconnects
+    disconnect_poll_interval: float = 0.5  # seconds between client disconnect checks
+
+    # Admin / Profiling (disabled unless ADMIN_TOKEN is set)
+    admin_token: Optional[str] = None
+    profile_max_seconds: float = 60.0
+
+    # Map-Reduce Generation for oversized specs
+    map_reduce_enabled: bool = True
+    map_reduce_min_bytes: int = 60000  # specs larger than this are split into parts of about this size
+    map_reduce_max_parts: int = 8  # parts grow beyond the size above rather than exceed this count
+    map_reduce_sheet_rows: int = 200  # rows per table when a large sheet is split
+    map_reduce_concurrency: int = 4  # parts generated at the same time
+    map_reduce_merge_max_chars: int = 120000  # longest merged program sent to the consolidation run
+    map_reduce_merge_timeout: int = 300  # seconds the consolidation run may take
+
+    # Thread Compaction
+    thread_truncation_last_messages: int = 0  # >0 sends only the last N messages per run, 0 = OpenAI "auto"
+    thread_compaction_enabled: bool = True
+    thread_compaction_token_threshold: int = 24000  # compact once a run costs this many tokens
+    thread_compaction_keep_messages: int = 6  # recent messages carried over verbatim
+    thread_summary_model: str = "gpt-4o-mini"
+    thread_summary_max_tokens: int = 1024
+
+    # SAP Data Dictionary tools, answered locally during assistant runs
+    ddic_tools_enabled: bool = True
+    ddic_snapshot_path: str = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "data", "ddic_snapshot.json"
+    )
+
+    # Spec Pre-Validation
+    templates_dir: str = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "public", "templates"
+    )
+    spec_validation_mode: str = "reject"  # reject | flag | off
+    templates_cache_seconds: int = 3600
+
     # n8n Webhook Configuration
     n8n_webhook_url: str = "https://pd03-n8n-free.hf.space/webhook/f36fd8cb-ff8d-44b1-9417-eefbb60ce13a"
     n8n_timeout: int = 120  # seconds - workflows may take time
+    n8n_connect_timeout: float = 10.0  # seconds - fail fast when the host is down
+
+    # n8n Circuit Breaker / Health Probes
+    n8n_breaker_failure_rate: float = 0.5  # open when half the recent calls fail
+    n8n_breaker_slow_call_seconds: float = 90.0  # calls slower than this count as slow
+    n8n_breaker_slow_call_rate: float = 0.8  # open when most recent calls are slow
+    n8n_breaker_window_size: int = 20
+    n8n_breaker_min_calls: int = 5
+    n8n_breaker_open_seconds: float = 30.0  # cool-down before a half-open trial call
+    n8n_health_probe_interval: float = 15.0  # seconds between background probes
+    n8n_breaker_probe_failures: int = 3  # consecutive failed probes that open the circuit
+
+    # Unified Serving (main_unified.py): OpenAI and n8n with request hedging
+    unified_primary_backend: str = "openai"  # openai | n8n
+    hedge_enabled: bool = True
+    hedge_percentile: float = 90.0  # primary latency percentile before the other backend is asked too
+    hedge_min_delay: float = 5.0  # seconds
+    hedge_max_delay: float = 60.0  # seconds
+    hedge_default_delay: float = 30.0  # seconds, until the primary has latency history
+
+    # OpenAI Circuit Breaker (unified mode)
+    openai_breaker_failure_rate: float = 0.5
+    openai_breaker_slow_call_seconds: float = 50.0  # runs time out after 60 seconds
+    openai_breaker_slow_call_rate: float = 0.8
+    openai_breaker_window_size: int = 20
+    openai_breaker_min_calls: int = 5
+    openai_breaker_open_seconds: float = 30.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,322 @@
+"""
+SAP Data Dictionary Tools
+Answers the assistant's table, field and data-element lookups from a local
+DDIC snapshot, so prompts only carry the spec and the model fetches the
+metadata it actually needs
+"""
+import json
+import os
+import re
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from config import settings
+from metrics import registry
+
+tool_calls_counter = registry.counter(
+    "abap_ddic_tool_calls_total", "Data dictionary tool calls answered locally"
+)
+
+# Appended to the assistant's instructions on every run while the tools are available
+DDIC_INSTRUCTIONS = (
+    "Use the ddic_* tools to look up SAP tables, fields and data elements "
+    "instead of guessing names, types or lengths."
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class DataElement(NamedTuple):
+    description: str
+    domain: str
+    datatype: str
+    length: int
+    decimals: int
+    check_table: str
+
+
+class Field(NamedTuple):
+    name: str
+    data_element: str
+    key: bool
+
+
+class Table(NamedTuple):
+    description: str
+    fields: Tuple[Field, ...]
+
+
+def _prefix_range(names: List[str], prefix: str) -> List[str]:
+    """All names in a sorted list that start with prefix"""
+    return names[bisect_left(names, prefix):bisect_right(names, prefix + "\uffff")]
+
+
+class DdicIndex:
+    """
+    In-memory data dictionary built once from a snapshot file.
+
+    Entries are tuples; lookups are dict hits and prefix searches are bisects
+    over sorted name lists, so every tool call is answered in microseconds.
+    """
+
+    def __init__(self, snapshot: Dict[str, Any]):
+        self.data_elements: Dict[str, DataElement] = {
+            name.upper(): DataElement(
+                entry.get("description", ""),
+                entry.get("domain", name).upper(),
+                entry.get("type", ""),
+                int(entry.get("length", 0)),
+                int(entry.get("decimals", 0)),
+                entry.get("check_table", "").upper(),
+            )
+            for name, entry in snapshot.get("data_elements", {}).items()
+        }
+        self.tables: Dict[str, Table] = {
+            name.upper(): Table(
+                entry.get("description", ""),
+                tuple(
+                    Field(field["name"].upper(), field["data_element"].upper(), bool(field.get("key")))
+                    for field in entry.get("fields", [])
+                ),
+            )
+            for name, entry in snapshot.get("tables", {}).items()
+        }
+
+        # Field name -> tables containing it; data element -> (table, field) usages
+        field_tables: Dict[str, List[str]] = {}
+        usages: Dict[str, List[Tuple[str, str]]] = {}
+        for table_name, table in sorted(self.tables.items()):
+            for field in table.fields:
+                field_tables.setdefault(field.name, []).append(table_name)
+                usages.setdefault(field.data_element, []).append((table_name, field.name))
+        self.field_tables: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in field_tables.items()}
+        self.usages: Dict[str, Tuple[Tuple[str, str], ...]] = {k: tuple(v) for k, v in usages.items()}
+
+        # Sorted names for prefix search
+        self.table_names = sorted(self.tables)
+        self.element_names = sorted(self.data_elements)
+        self.field_names = sorted(self.field_tables)
+
+        # Description word -> (kind, name), for searches like "material description"
+        words: Dict[str, List[Tuple[str, str]]] = {}
+        for kind, entries in (("table", self.tables), ("data_element", self.data_elements)):
+            for name, entry in entries.items():
+                for word in set(_WORD.findall(entry.description.lower())):
+                    words.setdefault(word, []).append((kind, name))
+        self.words: Dict[str, Tuple[Tuple[str, str], ...]] = {k: tuple(v) for k, v in words.items()}
+
+    def describe_element(self, name: str) -> Dict[str, Any]:
+        element = self.data_elements.get(name)
+        if element is None:
+            return {"data_element": name}
+        result = {
+            "data_element": name,
+            "description": element.description,
+            "domain": element.domain,
+            "type": element.datatype,
+            "length": element.length,
+        }
+        if element.decimals:
+            result["decimals"] = element.decimals
+        if element.check_table:
+            result["check_table"] = element.check_table
+        return result
+
+    def _describe_field(self, field: Field) -> Dict[str, Any]:
+        result = {"field": field.name, "key": field.key}
+        result.update(self.describe_element(field.data_element))
+        return result
+
+    def _not_found(self, kind: str, name: str, names: List[str]) -> Dict[str, Any]:
+        return {
+            "error": f"{kind} {name} is not in the data dictionary snapshot",
+            "similar": _prefix_range(names, name[:3])[:10],
+        }
+
+    def lookup_table(self, table_name: str) -> Dict[str, Any]:
+        """Table description and all fields with their types"""
+        name = table_name.strip().upper()
+        table = self.tables.get(name)
+        if table is None:
+            return self._not_found("Table", name, self.table_names)
+        return {
+            "table": name,
+            "description": table.description,
+            "key_fields": [field.name for field in table.fields if field.key],
+            "fields": [self._describe_field(field) for field in table.fields],
+        }
+
+    def lookup_field(self, field_name: str, table_name: Optional[str] = None) -> Dict[str, Any]:
+        """One table field, or every table that has a field of this name"""
+        name = field_name.strip().upper()
+        if table_name:
+            table_key = table_name.strip().upper()
+            table = self.tables.get(table_key)
+            if table is None:
+                return self._not_found("Table", table_key, self.table_names)
+            for field in table.fields:
+                if field.name == name:
+                    return {"table": table_key, **self._describe_field(field)}
+            return {
+                "error": f"Field {name} does not exist in table {table_key}",
+                "fields": [field.name for field in table.fields],
+            }
+
+        tables = self.field_tables.get(name)
+        if not tables:
+            return self._not_found("Field", name, self.field_names)
+        return {
+            "field": name,
+            "tables": [
+                {"table": table, **self._describe_field(self._field(table, name))}
+                for table in tables
+            ],
+        }
+
+    def _field(self, table_name: str, field_name: str) -> Field:
+        return next(field for field in self.tables[table_name].fields if field.name == field_name)
+
+    def lookup_data_element(self, data_element: str) -> Dict[str, Any]:
+        """Data element type details and the table fields that use it"""
+        name = data_element.strip().upper()
+        if name not in self.data_elements:
+            return self._not_found("Data element", name, self.element_names)
+        result = self.describe_element(name)
+        result["used_in"] = [f"{table}-{field}" for table, field in self.usages.get(name, ())]
+        return result
+
+    def search(self, query: str, kind: str = "any", limit: int = 20) -> Dict[str, Any]:
+        """Tables and data elements by name prefix or by words of their description"""
+        text = query.strip()
+        limit = max(1, min(int(limit), 100))
+        found: Dict[Tuple[str, str], None] = {}
+
+        if kind in ("any", "table"):
+            for name in _prefix_range(self.table_names, text.upper()):
+                found[("table", name)] = None
+        if kind in ("any", "data_element"):
+            for name in _prefix_range(self.element_names, text.upper()):
+                found[("data_element", name)] = None
+
+        words = _WORD.findall(text.lower())
+        if words:
+            matches = set(self.words.get(words[0], ()))
+            for word in words[1:]:
+                matches &= set(self.words.get(word, ()))
+            for entry_kind, name in sorted(matches):
+                if kind in ("any", entry_kind):
+                    found[(entry_kind, name)] = None
+
+        results = []
+        for entry_kind, name in list(found)[:limit]:
+            entries = self.tables if entry_kind == "table" else self.data_elements
+            results.append({"kind": entry_kind, "name": name, "description": entries[name].description})
+        return {"query": query, "results": results}
+
+    def call_tool(self, name: str, arguments: str) -> str:
+        """
+        Run one function tool call and return its JSON output.
+        Bad calls are answered with an error object so the run can continue.
+        """
+        handler = DDIC_TOOL_HANDLERS.get(name)
+        if handler is None:
+            return json.dumps({"error": f"Unknown tool {name}"})
+        try:
+            kwargs = json.loads(arguments or "{}")
+            result = handler(self, **kwargs)
+        except (AttributeError, TypeError, ValueError) as e:
+            result = {"error": f"Invalid arguments for {name}: {str(e)}"}
+        tool_calls_counter.inc(tool=name)
+        return json.dumps(result, ensure_ascii=False)
+
+
+DDIC_TOOL_HANDLERS = {
+    "ddic_lookup_table": DdicIndex.lookup_table,
+    "ddic_lookup_field": DdicIndex.lookup_field,
+    "ddic_lookup_data_element": DdicIndex.lookup_data_element,
+    "ddic_search": DdicIndex.search,
+}
+
+# Function tool definitions passed on runs.create
+DDIC_TOOLS: List[Dict[str, Any]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "ddic_lookup_table",
+            "description": "Get an SAP table's description, key fields and all fields with data element, type and length.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "table_name": {"type": "string", "description": "Table name, e.g. MARA"},
+                },
+                "required": ["table_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "ddic_lookup_field",
+            "description": (
+                "Get the data element, type and length of a table field. Without "
+                "table_name, lists every table that has a field of this name."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "field_name": {"type": "string", "description": "Field name, e.g. MATNR"},
+                    "table_name": {"type": "string", "description": "Optional table name, e.g. MAKT"},
+                },
+                "required": ["field_name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "ddic_lookup_data_element",
+            "description": "Get a data element's domain, type, length, check table and the table fields using it.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "data_element": {"type": "string", "description": "Data element name, e.g. MTART"},
+                },
+                "required": ["data_element"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "ddic_search",
+            "description": (
+                "Find tables and data elements whose name starts with the query "
+                "or whose description contains all of its words."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Name prefix or description words, e.g. 'MAR' or 'material type'"},
+                    "kind": {"type": "string", "enum": ["any", "table", "data_element"]},
+                    "limit": {"type": "integer", "description": "Maximum results (default 20)"},
+                },
+                "required": ["query"],
+            },
+        },
+    },
+]
+
+DDIC_TOOL_NAMES = frozenset(DDIC_TOOL_HANDLERS)
+
+
+def load_ddic(snapshot_path: str) -> Optional[DdicIndex]:
+    """Build the index from a snapshot file; None (tools disabled) if it is missing"""
+    if not os.path.exists(snapshot_path):
+        print(f"[WARN] DDIC snapshot {snapshot_path} not found, data dictionary tools are disabled")
+        return None
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        return DdicIndex(json.load(f))
+
+
+# Built once at import time
+DDIC: Optional[DdicIndex] = load_ddic(settings.ddic_snapshot_path) if settings.ddic_tools_enabled else None
@@ -0,0 +1,56 @@
+"""
+Client Disconnect Handling
+Cancels in-flight upstream work (assistant runs, n8n calls) when the client
+closes the connection before the response is ready
+"""
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import Request, Response
+
+from config import settings
+from metrics import registry
+
+T = TypeVar("T")
+
+disconnect_counter = registry.counter(
+    "abap_client_disconnects_total", "Requests abandoned by the client before completion"
+)
+
+# Non-standard status (nginx convention) logged for abandoned requests
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection while the request was being processed"""
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable` as a task while watching the client connection.
+    If the client disconnects first, the task is cancelled (which cancels
+    the remote run / upstream call it is waiting on) and ClientDisconnected
+    is raised.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.disconnect_poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    # Let the task run its cleanup, e.g. cancelling the remote run
+    await asyncio.gather(task, return_exceptions=True)
+    disconnect_counter.inc(path=request.url.path)
+    print(f"[INFO] Client disconnected, cancelled {request.method} {request.url.path}")
+    raise ClientDisconnected()
+
+
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected) -> Response:
+    """Nobody is listening any more; answer with an empty 499"""
+    return Response(status_code=CLIENT_CLOSED_REQUEST)
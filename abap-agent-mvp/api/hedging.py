@@ -0,0 +1,241 @@
+"""
+Hedged Generation
+Runs a generation on a primary backend (OpenAI Assistants or n8n) and, if it
+has not answered within a latency-percentile delay, on the other one too.
+The first good result wins and the slower request is cancelled.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import registry
+from n8n_client import N8nWorkflowClient
+from openai_client import OpenAIAssistantClient
+from thread_compaction import spec_metadata
+
+hedges_counter = registry.counter(
+    "abap_hedged_requests_total", "Generations also sent to the secondary backend after the hedge delay"
+)
+wins_counter = registry.counter(
+    "abap_backend_wins_total", "Generations answered, by winning backend"
+)
+failovers_counter = registry.counter(
+    "abap_backend_failovers_total", "Generations moved to the other backend"
+)
+
+
+class GenerationRequest(BaseModel):
+    """One spec generation, as understood by every backend"""
+
+    file_content: bytes
+    filename: str
+    parsed_content: str
+    message: Optional[str] = None
+    ricef_type: Optional[str] = None
+    thread_id: Optional[str] = None  # caller's conversation, continued by OpenAI
+    spec_message_id: Optional[str] = None  # set once OpenAI has added the spec to the thread
+
+
+class BackendError(Exception):
+    """A backend answered, but without a usable result"""
+
+
+class OpenAIBackend:
+    """
+    Generation on the caller's Assistants thread (a fresh one when none is
+    given), guarded by its own circuit breaker
+    """
+
+    name = "openai"
+
+    def __init__(self, client: OpenAIAssistantClient, breaker: CircuitBreaker):
+        self.client = client
+        self.breaker = breaker
+
+    async def generate(self, request: GenerationRequest) -> Dict[str, Any]:
+        self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            thread_id = request.thread_id or await self.client.create_thread()
+            await self._add_spec(thread_id, request)
+            response = await self.client.run_assistant(thread_id, request.ricef_type)
+        except asyncio.CancelledError:
+            # Lost the hedge or the client left: no verdict on OpenAI
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure(time.monotonic() - started)
+            raise
+        self.breaker.record_success(time.monotonic() - started)
+        return {
+            "content": response["content"],
+            "thread_id": thread_id,
+            "message_id": response["message_id"],
+            "thread_tokens": response["thread_tokens"],
+        }
+
+    async def record_answer(self, request: GenerationRequest, content: str) -> str:
+        """
+        Record another backend's answer on the caller's thread, so the
+        conversation continues from what the caller saw. The spec message is
+        added first unless this backend already added it before losing.
+        Returns the assistant message id.
+        """
+        if not await self.client.wait_for_idle(request.thread_id):
+            print(f"[WARN] Thread {request.thread_id} still has an active run")
+        if not request.spec_message_id:
+            await self._add_spec(request.thread_id, request)
+        return await self.client.add_message(request.thread_id, content, role="assistant")
+
+    async def _add_spec(self, thread_id: str, request: GenerationRequest) -> None:
+        message = request.message or "I've uploaded a file for processing."
+        request.spec_message_id = await self.client.add_message(
+            thread_id,
+            f"{message}\n\nFile: {request.filename}\n\n{request.parsed_content}",
+            metadata=spec_metadata(request.filename, message),
+        )
+
+
+class N8nBackend:
+    """Generation through the n8n webhook; the client keeps its own circuit breaker"""
+
+    name = "n8n"
+
+    def __init__(self, client: N8nWorkflowClient):
+        self.client = client
+        self.breaker = client.breaker
+
+    async def generate(self, request: GenerationRequest) -> Dict[str, Any]:
+        result = await self.client.send_file_to_workflow(
+            file_content=request.file_content,
+            filename=request.filename,
+            additional_data={"message": request.message} if request.message else None,
+        )
+        if not result.get("success"):
+            raise BackendError(result.get("error") or result.get("content") or "Workflow failed")
+        # n8n has no conversations; the caller's thread stays the current one
+        return {
+            "content": result.get("content", ""),
+            "thread_id": request.thread_id,
+            "message_id": None,
+            "thread_tokens": None,
+        }
+
+
+class HedgedGenerator:
+    """
+    Hedging policy over two backends.
+
+    The primary gets the request first. If it has not answered after the
+    hedge delay (its `percentile` latency, clamped to [min_delay, max_delay]),
+    the secondary is asked as well. A backend that fails or whose circuit is
+    open hands the request to the other one straight away.
+    """
+
+    def __init__(
+        self,
+        backends: List[Any],
+        percentile: float = 90.0,
+        min_delay: float = 5.0,
+        max_delay: float = 60.0,
+        default_delay: float = 30.0,
+        enabled: bool = True,
+    ):
+        self.backends = {backend.name: backend for backend in backends}
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.enabled = enabled
+
+    def hedge_delay(self, backend: Any) -> float:
+        """Seconds to wait for `backend` before asking the other one too"""
+        observed = backend.breaker.latency_percentile(self.percentile)
+        if not observed:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, observed))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Circuit state and current hedge delay per backend, for health endpoints"""
+        return {
+            name: {
+                "circuit": backend.breaker.snapshot(),
+                "hedge_delay": round(self.hedge_delay(backend), 3),
+            }
+            for name, backend in self.backends.items()
+        }
+
+    async def generate(self, request: GenerationRequest, primary: str) -> Dict[str, Any]:
+        """
+        Generate with hedging and failover.
+        Returns the winning result plus `backend` and `hedged`.
+
+        Raises:
+            CircuitOpenError: If every backend's circuit is open
+            BackendError: If every backend failed
+        """
+        if primary not in self.backends:
+            raise ValueError(f"Unknown backend '{primary}'. Expected one of: {', '.join(self.backends)}")
+        candidates = [self.backends[primary]] + [
+            backend for name, backend in self.backends.items() if name != primary
+        ]
+        available = [b for b in candidates if b.breaker.state != CircuitBreaker.OPEN]
+        if not available:
+            raise CircuitOpenError(
+                "all backends", min(b.breaker.retry_after() for b in candidates)
+            )
+        if available[0] is not candidates[0]:
+            failovers_counter.inc(backend=primary, reason="circuit_open")
+
+        waiting = available[1:]
+        running: Dict[asyncio.Task, Any] = {}
+        circuit_errors: List[CircuitOpenError] = []
+        errors: List[str] = []
+        hedged = False
+
+        def launch(backend: Any) -> None:
+            running[asyncio.create_task(backend.generate(request))] = backend
+
+        launch(available[0])
+        try:
+            while running:
+                # Only the first backend is hedged; after a failure the next one runs alone
+                hedge = self.enabled and waiting and not hedged and not errors
+                timeout = self.hedge_delay(available[0]) if hedge else None
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    hedges_counter.inc(primary=available[0].name)
+                    launch(waiting.pop(0))
+                    continue
+
+                for task in done:
+                    backend = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if isinstance(e, CircuitOpenError):
+                            circuit_errors.append(e)
+                        errors.append(f"{backend.name}: {e}")
+                        print(f"[WARN] Backend {backend.name} failed: {e}")
+                        if waiting and not running:
+                            failovers_counter.inc(backend=backend.name, reason="error")
+                            launch(waiting.pop(0))
+                        continue
+                    wins_counter.inc(backend=backend.name)
+                    return {**result, "backend": backend.name, "hedged": hedged}
+        finally:
+            # Cancel the losers and wait for their cleanup (OpenAI cancels its
+            # run), so the caller's thread has settled once this returns
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if len(circuit_errors) == len(errors):
+            raise circuit_errors[0]
+        raise BackendError("; ".join(errors))
@@ -0,0 +1,61 @@
+"""
+HTTP Caching Helpers
+Strong ETags and If-None-Match handling for conditional GET
+"""
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+
+# Content codings applied by CompressionMiddleware
+ENCODINGS = ("br", "gzip")
+
+
+def strong_etag(*parts: bytes) -> str:
+    """Build a strong ETag from the bytes that define a representation"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def messages_etag(messages: Iterable[Dict[str, Any]]) -> str:
+    """ETag for a thread history, derived from message IDs and content"""
+    parts = []
+    for message in messages:
+        parts.append(str(message["id"]).encode())
+        parts.append(str(message["role"]).encode())
+        parts.append(str(message["created_at"]).encode())
+        parts.append(str(message["content"]).encode("utf-8"))
+    return strong_etag(*parts)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    ETag of a content-coded representation: the identity ETag with the coding
+    appended ("abc" -> "abc-br"), as strong ETags must differ per encoding
+    """
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else etag
+
+
+def _identity_etag(tag: str) -> str:
+    """Strip the weak prefix and any content-coding suffix from an ETag"""
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the current ETag (weak comparison).
+    Tags of compressed representations match their identity ETag.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (_identity_etag(tag) for tag in candidates)
@@ -0,0 +1,329 @@
+"""
+Incremental JSON helpers
+Pull a single string field out of a JSON document while it is still arriving,
+and pretty-print large documents without building the object tree
+"""
+import re
+from typing import Iterable, Iterator, List, Optional
+
+# Characters that interrupt a run of plain string content
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """
+    Streaming extractor for the string value that n8n_client._extract_content
+    would pick, in the cases where that can be decided before the body ends.
+
+    Only two kinds of value qualify: a top-level string (or the first item of
+    top-level lists), and a non-blank string under one of `keys` in the root
+    object (or in the first item of top-level lists). `keys` must therefore be
+    the highest-priority content keys; any other value could still be
+    outranked by a key that arrives later, so callers buffer and fall back.
+
+    Feed decoded text chunks in order; each call returns the part of the
+    target value decoded so far. Memory stays constant apart from the
+    whitespace held back while deciding whether a value is blank.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = frozenset(keys)
+        self.started = False  # a qualifying, non-blank target has begun
+        self.finished = False  # target value is complete
+
+        # One frame per open container: [bracket, on_primary_path, items_before]
+        self._stack: List[list] = []
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        self._value_key: Optional[str] = None  # key owning the next value
+        self._in_string = False
+        self._string_kind = "skip"  # "key", "target" or "skip"
+        self._key_buf: List[str] = []
+        self._held: Optional[List[str]] = None  # blank-so-far target content
+        self._escape = ""
+        self._high_surrogate: Optional[int] = None
+
+    def feed(self, text: str) -> str:
+        """Consume a chunk and return newly decoded target content"""
+        out: List[str] = []
+        i, n = 0, len(text)
+        while i < n and not self.finished:
+            if self._in_string:
+                i = self._scan_string(text, i, out)
+                continue
+
+            ch = text[i]
+            i += 1
+            if ch == '"':
+                self._begin_string()
+            elif ch in "{[":
+                self._stack.append([ch, self._on_primary_path(), 0])
+                self._expect_key = ch == "{"
+                self._value_key = None
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+            elif ch == ",":
+                if self._stack:
+                    self._stack[-1][2] += 1
+                self._expect_key = bool(self._stack) and self._stack[-1][0] == "{"
+            elif ch == ":":
+                self._expect_key = False
+                self._value_key = self._last_key
+            elif not ch.isspace():
+                # Number or literal value
+                self._value_key = None
+        return "".join(out)
+
+    def _on_primary_path(self) -> bool:
+        """Whether a value starting now is one _extract_content looks at first"""
+        if not self._stack:
+            return True
+        bracket, primary, items_before = self._stack[-1]
+        return bracket == "[" and primary and items_before == 0
+
+    def _begin_string(self) -> None:
+        self._in_string = True
+        self._string_kind = "skip"
+        if self._stack and self._stack[-1][0] == "{" and self._expect_key:
+            self._string_kind = "key"
+            self._key_buf = []
+        elif self._on_primary_path():
+            # Plain string where a document is expected: used as is, even blank
+            self._string_kind = "target"
+            self.started = True
+        elif self._stack[-1][0] == "{" and self._stack[-1][1] and self._value_key in self.keys:
+            # Content key: only counts once it turns out to be non-blank
+            self._string_kind = "target"
+            self._held = []
+        self._value_key = None
+
+    def _end_string(self) -> None:
+        self._in_string = False
+        if self._string_kind == "key":
+            self._last_key = "".join(self._key_buf)
+            self._key_buf = []
+        elif self._string_kind == "target":
+            if self._held is not None:
+                # Blank value: _extract_content skips it, so keep looking
+                self._held = None
+            else:
+                self.finished = True
+        self._string_kind = "skip"
+
+    def _emit(self, chunk: str, out: List[str]) -> None:
+        if self._string_kind == "target":
+            if self._held is not None:
+                if not chunk.strip():
+                    self._held.append(chunk)
+                    return
+                out.extend(self._held)
+                self._held = None
+                self.started = True
+            out.append(chunk)
+        elif self._string_kind == "key":
+            self._key_buf.append(chunk)
+
+    def _scan_string(self, text: str, i: int, out: List[str]) -> int:
+        n = len(text)
+        while i < n:
+            if self._escape:
+                self._escape += text[i]
+                i += 1
+                if self._escape[1] == "u":
+                    if len(self._escape) < 6:
+                        continue
+                    try:
+                        decoded = self._decode_unicode(int(self._escape[2:], 16))
+                    except ValueError:
+                        decoded = "\ufffd"
+                else:
+                    decoded = _SIMPLE_ESCAPES.get(self._escape[1], self._escape[1])
+                self._escape = ""
+                if decoded:
+                    self._emit(decoded, out)
+                continue
+
+            match = _STRING_SPECIAL.search(text, i)
+            end = match.start() if match else n
+            if end > i:
+                self._flush_surrogate(out)
+                self._emit(text[i:end], out)
+            if not match:
+                return n
+            if match.group() == '"':
+                self._flush_surrogate(out)
+                self._end_string()
+                return end + 1
+            self._escape = "\\"
+            i = end + 1
+        return i
+
+    def _decode_unicode(self, code: int) -> str:
+        if 0xD800 <= code <= 0xDBFF:
+            pending = "\ufffd" if self._high_surrogate is not None else ""
+            self._high_surrogate = code
+            return pending
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            return chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00))
+        prefix = "\ufffd" if self._high_surrogate is not None else ""
+        self._high_surrogate = None
+        if 0xDC00 <= code <= 0xDFFF:
+            return prefix + "\ufffd"
+        return prefix + chr(code)
+
+    def _flush_surrogate(self, out: List[str]) -> None:
+        if self._high_surrogate is not None:
+            self._high_surrogate = None
+            self._emit("\ufffd", out)
+
+
+# One JSON token after optional whitespace; group 2 catches anything invalid.
+# The string quantifiers are possessive: an unterminated string fails in
+# linear time instead of retrying every split of its characters.
+_TOKEN = re.compile(
+    rb"""[ \t\n\r]*(?:
+        (   "(?:[^"\\\x00-\x1f]++|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*+"
+          | -?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?
+          | true | false | null
+          | [{}\[\]:,]
+        )
+      | (.)
+    )""",
+    re.VERBOSE | re.DOTALL,
+)
+
+# Parser states
+_VALUE, _KEY, _COLON, _AFTER, _DONE = range(5)
+_OPEN_OBJECT, _OPEN_ARRAY, _CLOSE_OBJECT, _CLOSE_ARRAY = b"{[}]"
+_COMMA, _COLON_CHAR, _QUOTE = ord(","), ord(":"), ord('"')
+
+
+class JsonStreamError(ValueError):
+    """Raised when a document is malformed or exceeds the configured limits"""
+
+
+def iter_pretty_json(
+    data: bytes,
+    max_depth: int = 64,
+    max_output: Optional[int] = None,
+    indent: int = 2,
+    chunk_size: int = 64 * 1024,
+) -> Iterator[str]:
+    """
+    Re-indent a JSON document token by token, without building the object tree.
+
+    Output matches json.dumps(indent=...) layout, except that strings and
+    numbers are copied verbatim. Decoded text is yielded in chunks of roughly
+    `chunk_size` bytes. Raises JsonStreamError on malformed input, nesting
+    deeper than `max_depth` or output larger than `max_output` bytes.
+    """
+    newlines = [b"\n" + b" " * (indent * depth) for depth in range(max_depth + 1)]
+    separators = [b"," + line for line in newlines]
+    start = 3 if data.startswith(b"\xef\xbb\xbf") else 0
+    # Trailing whitespace (the final newline editors add) is not a token
+    end = len(data.rstrip(b" \t\n\r"))
+    stack = bytearray()  # open brackets
+    state = _VALUE
+    just_opened = False
+    out: List[bytes] = []
+    append = out.append
+    buffered = 0
+    emitted = 0
+
+    for match in _TOKEN.finditer(data, start, end):
+        token = match.group(1)
+        if token is None or state == _DONE:
+            raise JsonStreamError(f"Invalid JSON at byte {match.start(2 if token is None else 1)}")
+        first = token[0]
+
+        if first == _OPEN_OBJECT or first == _OPEN_ARRAY:
+            if state != _VALUE:
+                raise JsonStreamError(f"Unexpected '{chr(first)}' at byte {match.start(1)}")
+            if just_opened:
+                append(newlines[len(stack)])
+            if len(stack) >= max_depth:
+                raise JsonStreamError(f"JSON nesting deeper than {max_depth} levels")
+            stack.append(first)
+            append(token)
+            state = _KEY if first == _OPEN_OBJECT else _VALUE
+            just_opened = True
+            buffered += 2
+        elif first == _CLOSE_OBJECT or first == _CLOSE_ARRAY:
+            opener = _OPEN_OBJECT if first == _CLOSE_OBJECT else _OPEN_ARRAY
+            if not stack or stack[-1] != opener or not (
+                state == _AFTER or (just_opened and state != _COLON)
+            ):
+                raise JsonStreamError(f"Unexpected '{chr(first)}' at byte {match.start(1)}")
+            stack.pop()
+            if not just_opened:
+                append(newlines[len(stack)])
+                buffered += len(stack) * indent + 1
+            append(token)
+            buffered += 1
+            just_opened = False
+            state = _AFTER if stack else _DONE
+        elif first == _COMMA:
+            if state != _AFTER or not stack:
+                raise JsonStreamError(f"Unexpected ',' at byte {match.start(1)}")
+            append(separators[len(stack)])
+            buffered += len(stack) * indent + 2
+            state = _KEY if stack[-1] == _OPEN_OBJECT else _VALUE
+        elif first == _COLON_CHAR:
+            if state != _COLON:
+                raise JsonStreamError(f"Unexpected ':' at byte {match.start(1)}")
+            append(b": ")
+            buffered += 2
+            state = _VALUE
+        else:
+            if state == _KEY:
+                if first != _QUOTE:
+                    raise JsonStreamError(f"Expected object key at byte {match.start(1)}")
+                state = _COLON
+            elif state == _VALUE:
+                state = _AFTER if stack else _DONE
+            else:
+                raise JsonStreamError(f"Unexpected value at byte {match.start(1)}")
+            if just_opened:
+                append(newlines[len(stack)])
+                buffered += len(stack) * indent + 1
+                just_opened = False
+            append(token)
+            buffered += len(token)
+
+        if buffered >= chunk_size:
+            emitted += buffered
+            if max_output is not None and emitted > max_output:
+                raise JsonStreamError(f"Formatted JSON exceeds {max_output} bytes")
+            yield _decode_chunk(out)
+            out.clear()
+            buffered = 0
+
+    if state != _DONE:
+        raise JsonStreamError("Unexpected end of JSON document")
+    emitted += buffered
+    if max_output is not None and emitted > max_output:
+        raise JsonStreamError(f"Formatted JSON exceeds {max_output} bytes")
+    if out:
+        yield _decode_chunk(out)
+
+
+def _decode_chunk(pieces: List[bytes]) -> str:
+    # Chunks always end on a token boundary, so UTF-8 sequences are never split
+    try:
+        return b"".join(pieces).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise JsonStreamError(f"Invalid UTF-8 in JSON document: {e.reason}")
@@ -0,0 +1,116 @@
+"""
+Load Shedding
+Measures event-loop lag and in-flight requests, and rejects low-priority
+work with 503 while the process is overloaded
+"""
+import asyncio
+import time
+from typing import Optional, Tuple
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import registry
+
+loop_lag_gauge = registry.gauge(
+    "abap_event_loop_lag_seconds", "Smoothed event-loop scheduling delay"
+)
+in_flight_gauge = registry.gauge(
+    "abap_requests_in_flight", "HTTP requests currently being processed"
+)
+shed_counter = registry.counter(
+    "abap_requests_shed_total", "Requests rejected with 503 by load shedding"
+)
+admitted_counter = registry.counter(
+    "abap_low_priority_requests_admitted_total", "Low-priority requests let through by load shedding"
+)
+
+# Path prefixes whose requests are shed first: uploads and batch generation
+LOW_PRIORITY_PREFIXES: Tuple[str, ...] = ("/api/upload",)
+
+
+class LoopLagMonitor:
+    """
+    Background sampler of event-loop lag.
+    Sleeps for `interval` and measures how late it wakes up; the excess is
+    time the loop spent busy with other work.
+    """
+
+    def __init__(self, interval: float = 0.5, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag = 0.0  # exponentially smoothed, seconds
+
+    async def run(self) -> None:
+        """Sample forever; run as a background task"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, time.monotonic() - started - self.interval)
+            self.lag += self.smoothing * (sample - self.lag)
+            loop_lag_gauge.set(round(self.lag, 4))
+
+
+class LoadSheddingMiddleware:
+    """
+    Reject low-priority requests with 503 + Retry-After while the event loop
+    lags by more than `lag_threshold` seconds or more than `max_in_flight`
+    requests are being processed. Other requests (health, history, chat)
+    are always admitted.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        monitor: LoopLagMonitor,
+        lag_threshold: float = 0.25,
+        max_in_flight: int = 64,
+        retry_after: int = 5,
+    ):
+        self.app = app
+        self.monitor = monitor
+        self.lag_threshold = lag_threshold
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def shed_reason(self, path: str) -> Optional[str]:
+        """Why a request to `path` should be rejected right now, if at all"""
+        if not path.startswith(LOW_PRIORITY_PREFIXES):
+            return None
+        if self.monitor.lag > self.lag_threshold:
+            return "loop_lag"
+        if self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        reason = self.shed_reason(path)
+        if reason:
+            shed_counter.inc(path=path, reason=reason)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": b'{"detail":"Server is overloaded, please retry later"}',
+            })
+            return
+        if path.startswith(LOW_PRIORITY_PREFIXES):
+            admitted_counter.inc(path=path)
+
+        self.in_flight += 1
+        in_flight_gauge.set(self.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            in_flight_gauge.set(self.in_flight)
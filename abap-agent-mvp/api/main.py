@@ -2,21 +2,42 @@
 ABAP Agent MVP - FastAPI Backend
 Provides API endpoints for OpenAI Assistant interaction
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Response
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 from typing import Optional, List
+import asyncio
 import os
 
 from config import settings
+from app_setup import install_middlewares, router
+from disconnect import ClientDisconnected, cancel_on_disconnect
+from http_cache import etag_matches, messages_etag
+from load_shedding import LoopLagMonitor
+from map_reduce import generate_map_reduce, partition_spec
 from openai_client import OpenAIAssistantClient
-from utils import get_file_content_as_text
+from profiling import stage
+from thread_compaction import ThreadCompactor, spec_metadata
+from uploads import read_upload
+
+# Event-loop lag sampler feeding load shedding
+lag_monitor = LoopLagMonitor(interval=settings.loop_lag_sample_interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Sample event-loop lag in the background for the lifetime of the app"""
+    lag_task = asyncio.create_task(lag_monitor.run())
+    yield
+    lag_task.cancel()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="ABAP Agent API",
     description="Backend API for ABAP Code Generation Assistant",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -24,18 +45,27 @@ app = FastAPI(
 cors_origins = settings.cors_origins.split(",")
 allow_all_origins = os.getenv("ENVIRONMENT", "development") == "development"
 
-app.add_middleware(
-    CORSMiddleware,
+install_middlewares(
+    app,
+    lag_monitor,
     allow_origins=cors_origins if not allow_all_origins else ["http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:5173", "http://127.0.0.1:3000", "http://localhost:5174", "http://127.0.0.1:5174"],
     allow_origin_regex=r"https://.*-5173\.app\.github\.dev" if allow_all_origins else None,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.include_router(router)
 
 # Initialize OpenAI client
 openai_client = OpenAIAssistantClient()
 
+# Summarizes long threads into a fresh one before they get slow and expensive
+thread_compactor = ThreadCompactor(
+    openai_client,
+    token_threshold=settings.thread_compaction_token_threshold,
+    keep_messages=settings.thread_compaction_keep_messages,
+)
+
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -91,11 +121,25 @@ async def create_thread():
         raise HTTPException(status_code=500, detail=f"Failed to create thread: {str(e)}")
 
 
-@app.get("/api/threads/{thread_id}/messages", response_model=List[MessageResponse])
-async def get_thread_messages(thread_id: str, limit: int = 50):
-    """Get all messages from a thread"""
+@app.get(
+    "/api/threads/{thread_id}/messages",
+    response_model=List[MessageResponse],
+    responses={304: {"description": "History unchanged since the given ETag"}},
+)
+async def get_thread_messages(
+    thread_id: str, request: Request, response: Response, limit: int = 50
+):
+    """
+    Get all messages from a thread.
+    Supports If-None-Match: an unchanged history is answered with 304.
+    """
     try:
         messages = await openai_client.get_thread_messages(thread_id, limit)
+        etag = messages_etag(messages)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=cache_headers)
+        response.headers.update(cache_headers)
         return [MessageResponse(**msg) for msg in messages]
     except Exception as e:
         raise HTTPException(
@@ -104,22 +148,30 @@ async def get_thread_messages(thread_id: str, limit: int = 50):
 
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Send a message to the assistant and get a response
     Creates a new thread if thread_id is not provided
+    Long threads are compacted first: the returned thread_id may be a new one
+    The run is cancelled if the client disconnects before it completes
     """
     try:
         # Create thread if not provided
         thread_id = request.thread_id
         if not thread_id:
             thread_id = await openai_client.create_thread()
+        else:
+            thread_id = await thread_compactor.maybe_compact(thread_id)
 
-        # Add user message to thread
-        await openai_client.add_message(thread_id, request.message)
+        async def generate():
+            # Add user message to thread
+            await openai_client.add_message(thread_id, request.message)
 
-        # Run assistant and get response
-        response = await openai_client.run_assistant(thread_id, request.ricef_type)
+            # Run assistant and get response
+            return await openai_client.run_assistant(thread_id, request.ricef_type)
+
+        response = await cancel_on_disconnect(http_request, generate())
+        thread_compactor.record(thread_id, response["thread_tokens"])
 
         return ChatResponse(
             thread_id=thread_id,
@@ -127,55 +179,71 @@ async def chat(request: ChatRequest):
             content=response["content"],
             role=response["role"],
         )
+    except ClientDisconnected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
 
 @app.post("/api/upload")
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
     thread_id: Optional[str] = Form(None),
     message: Optional[str] = Form("I've uploaded a file for processing."),
     ricef_type: Optional[str] = Form(None),
+    split: Optional[bool] = Form(None),
 ):
     """
     Upload a file, extract its content, and send to assistant as text.
     No file attachments - just parsed content in the message.
+
+    Specs larger than MAP_REDUCE_MIN_BYTES are split along their main section
+    (output fields, segments, mappings) or sheets into at most
+    MAP_REDUCE_MAX_PARTS parts, generated concurrently and merged locally.
+    Pass split=false to always send it whole.
+    Generation is cancelled if the client disconnects before it completes.
     """
     try:
-        # Validate file type
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in settings.allowed_file_types:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File type {file_ext} not allowed. Allowed types: {settings.allowed_file_types}",
-            )
-
-        # Read file content
-        file_content = await file.read()
-
-        # Check file size
-        if len(file_content) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Max size: {settings.max_file_size} bytes",
-            )
-
-        # Extract text from file
-        parsed_content = get_file_content_as_text(file_content, file.filename)
-        
-        # Build message with file content
-        enhanced_message = f"{message}\n\nFile: {file.filename}\n\n{parsed_content}"
+        # Check, extract and validate the spec off the event loop,
+        # keeping the parsed document when it may be split
+        splitting = split is not False and settings.map_reduce_enabled
+        upload = await read_upload(file, ricef_type, keep_spec=splitting)
+
+        # Split oversized specs along natural boundaries
+        parts = []
+        if splitting:
+            with stage("partition"):
+                parts = await asyncio.to_thread(
+                    partition_spec, upload.content, file.filename, upload.spec
+                )
 
         # Create thread if needed
         if not thread_id:
             thread_id = await openai_client.create_thread()
+        else:
+            thread_id = await thread_compactor.maybe_compact(thread_id)
+
+        async def generate():
+            if parts:
+                return await generate_map_reduce(
+                    openai_client, thread_id, message, file.filename, parts, ricef_type
+                )
+
+            # Build message with file content
+            enhanced_message = f"{message}\n\nFile: {file.filename}\n\n{upload.text}"
+
+            # Send message (no file attachment), tagged so compaction can
+            # replace the spec body with a reference once it has been answered
+            await openai_client.add_message(
+                thread_id, enhanced_message, metadata=spec_metadata(file.filename, message)
+            )
 
-        # Send message (no file attachment)
-        await openai_client.add_message(thread_id, enhanced_message)
+            # Get response
+            return await openai_client.run_assistant(thread_id, ricef_type)
 
-        # Get response
-        response = await openai_client.run_assistant(thread_id, ricef_type)
+        response = await cancel_on_disconnect(request, generate())
+        thread_compactor.record(thread_id, response["thread_tokens"])
 
         return {
             "thread_id": thread_id,
@@ -183,8 +251,10 @@ async def upload_file(
             "message_id": response["message_id"],
             "content": response["content"],
             "role": response["role"],
+            "validation_warnings": upload.validation_warnings,
+            "parts": len(parts) or 1,
         }
-    except HTTPException:
+    except (HTTPException, ClientDisconnected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
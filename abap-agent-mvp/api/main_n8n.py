@@ -3,40 +3,71 @@ ABAP Agent MVP - n8n Webhook Backend
 Provides API endpoints for n8n workflow integration
 """
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import json
+import math
 
 from config import settings
-from n8n_client import N8nWorkflowClient
+from app_setup import install_middlewares, router
+from circuit_breaker import CircuitOpenError
+from disconnect import ClientDisconnected, cancel_on_disconnect, disconnect_counter
+from load_shedding import LoopLagMonitor
+from n8n_client import N8nWorkflowClient, N8nWorkflowError
+from uploads import read_upload
+
+# Initialize n8n client
+n8n_client = N8nWorkflowClient()
+
+# Ends the streamed content; a JSON trailer with the outcome follows it
+STREAM_TRAILER_SEPARATOR = "\x00"
+
+# Event-loop lag sampler feeding load shedding
+lag_monitor = LoopLagMonitor(interval=settings.loop_lag_sample_interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run n8n health probes and lag sampling in the background"""
+    background_tasks = [
+        asyncio.create_task(n8n_client.run_health_probes()),
+        asyncio.create_task(lag_monitor.run()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="ABAP Agent API (n8n)",
     description="Backend API for ABAP Code Generation via n8n Workflow",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS - allow all origins in development for Codespaces compatibility
 # Note: When using allow_origins=["*"], credentials must be False
-app.add_middleware(
-    CORSMiddleware,
+install_middlewares(
+    app,
+    lag_monitor,
     allow_origins=["*"],
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.include_router(router)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"[DEBUG] Request: {request.method} {request.url} Origin: {request.headers.get('origin')}")
-    response = await call_next(request)
-    print(f"[DEBUG] Response status: {response.status_code}")
-    return response
-
-# Initialize n8n client
-n8n_client = N8nWorkflowClient()
+if settings.debug:
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        print(f"[DEBUG] Request: {request.method} {request.url} Origin: {request.headers.get('origin')}")
+        response = await call_next(request)
+        print(f"[DEBUG] Response status: {response.status_code}")
+        return response
 
 
 # Response Models
@@ -46,6 +77,7 @@ class UploadResponse(BaseModel):
     filename: str
     content: str
     error: Optional[str] = None
+    validation_warnings: List[str] = []
 
 
 class HealthResponse(BaseModel):
@@ -70,42 +102,43 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    """Detailed health check including n8n connectivity"""
-    n8n_reachable = await n8n_client.health_check()
+    """
+    Detailed health check including n8n connectivity.
+    Served from the cached background probe, never calls the webhook inline.
+    """
+    n8n_health = n8n_client.cached_health()
     return {
         "status": "healthy",
         "n8n_webhook_configured": bool(settings.n8n_webhook_url),
-        "n8n_reachable": n8n_reachable
+        "n8n_reachable": n8n_health["reachable"],
+        "n8n_checked_at": n8n_health["checked_at"],
+        "n8n_circuit": n8n_health["circuit"],
     }
 
 
+def circuit_open_response(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when the n8n circuit will accept calls again"""
+    return HTTPException(
+        status_code=503,
+        detail="n8n workflow is currently unavailable, please retry later",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
 @app.post("/api/upload", response_model=UploadResponse)
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
     message: Optional[str] = Form(None),
 ):
     """
     Upload a file to the n8n workflow for processing.
     The file is sent directly to the n8n webhook as form-data.
+    The webhook call is dropped if the client disconnects first.
     """
     try:
-        # Validate file type
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in settings.allowed_file_types:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File type {file_ext} not allowed. Allowed types: {settings.allowed_file_types}",
-            )
-
-        # Read file content
-        file_content = await file.read()
-
-        # Check file size
-        if len(file_content) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Max size: {settings.max_file_size} bytes",
-            )
+        # The workflow parses the file itself, only validate it here
+        upload = await read_upload(file, extract_text=False)
 
         # Prepare additional data if message provided
         additional_data = {}
@@ -113,25 +146,86 @@ async def upload_file(
             additional_data["message"] = message
 
         # Send to n8n workflow
-        result = await n8n_client.send_file_to_workflow(
-            file_content=file_content,
+        result = await cancel_on_disconnect(request, n8n_client.send_file_to_workflow(
+            file_content=upload.content,
             filename=file.filename,
             additional_data=additional_data if additional_data else None
-        )
+        ))
 
         return UploadResponse(
             success=result.get("success", False),
             filename=file.filename,
             content=result.get("content", "No response from workflow"),
-            error=result.get("error")
+            error=result.get("error"),
+            validation_warnings=upload.validation_warnings,
         )
 
-    except HTTPException:
+    except CircuitOpenError as e:
+        raise circuit_open_response(e)
+    except (HTTPException, ClientDisconnected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@app.post("/api/upload/stream")
+async def upload_file_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    message: Optional[str] = Form(None),
+):
+    """
+    Upload a file to the n8n workflow and stream the generated content back
+    as plain text while the workflow response is still arriving.
+    Errors before the first chunk are reported with a normal status code.
+    Every complete stream ends with STREAM_TRAILER_SEPARATOR and a JSON
+    trailer: {"success", "error", "validation_warnings"}. Errors after the
+    first chunk are reported there; a stream without a trailer was cut off.
+    If the client disconnects, the webhook call is closed.
+    """
+    upload = await read_upload(file, extract_text=False)
+
+    stream = n8n_client.stream_file_to_workflow(
+        file_content=upload.content,
+        filename=file.filename,
+        additional_data={"message": message} if message else None,
+    )
+    try:
+        first_chunk = await cancel_on_disconnect(request, stream.__anext__())
+    except StopAsyncIteration:
+        first_chunk = ""
+    except CircuitOpenError as e:
+        raise circuit_open_response(e)
+    except N8nWorkflowError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    def trailer(error: Optional[str] = None) -> str:
+        return STREAM_TRAILER_SEPARATOR + json.dumps({
+            "success": error is None,
+            "error": error,
+            "validation_warnings": upload.validation_warnings,
+        })
+
+    async def relay():
+        if first_chunk:
+            yield first_chunk
+        try:
+            async for chunk in stream:
+                yield chunk
+        except asyncio.CancelledError:
+            # StreamingResponse cancels the body when the client disconnects
+            disconnect_counter.inc(path=request.url.path)
+            raise
+        except Exception as e:
+            # The status line is already sent: the trailer carries the error
+            print(f"[WARN] n8n stream failed after output started: {e}")
+            yield trailer(str(e))
+            return
+        yield trailer()
+
+    return StreamingResponse(relay(), media_type="text/plain; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.api_host, port=settings.api_port)
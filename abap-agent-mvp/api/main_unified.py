@@ -0,0 +1,283 @@
+"""
+ABAP Agent MVP - Unified Backend
+Serves generations from OpenAI Assistants and the n8n workflow with request
+hedging: a slow primary is backed up by the other backend, and traffic fails
+over automatically while one backend's circuit is open
+"""
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import math
+import time
+
+from config import settings
+from app_setup import install_middlewares, router
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from disconnect import ClientDisconnected, cancel_on_disconnect
+from hedging import BackendError, GenerationRequest, HedgedGenerator, N8nBackend, OpenAIBackend
+from load_shedding import LoopLagMonitor
+from n8n_client import N8nWorkflowClient
+from openai_client import OpenAIAssistantClient
+from profiling import stage
+from thread_compaction import ThreadCompactor
+from uploads import read_upload
+
+# Initialize clients
+openai_client = OpenAIAssistantClient()
+n8n_client = N8nWorkflowClient()
+
+openai_breaker = CircuitBreaker(
+    "openai",
+    failure_rate_threshold=settings.openai_breaker_failure_rate,
+    slow_call_seconds=settings.openai_breaker_slow_call_seconds,
+    slow_call_rate_threshold=settings.openai_breaker_slow_call_rate,
+    window_size=settings.openai_breaker_window_size,
+    min_calls=settings.openai_breaker_min_calls,
+    open_seconds=settings.openai_breaker_open_seconds,
+)
+
+openai_backend = OpenAIBackend(openai_client, openai_breaker)
+
+generator = HedgedGenerator(
+    [openai_backend, N8nBackend(n8n_client)],
+    percentile=settings.hedge_percentile,
+    min_delay=settings.hedge_min_delay,
+    max_delay=settings.hedge_max_delay,
+    default_delay=settings.hedge_default_delay,
+    enabled=settings.hedge_enabled,
+)
+
+# Summarizes long threads into a fresh one before they get slow and expensive
+thread_compactor = ThreadCompactor(
+    openai_client,
+    token_threshold=settings.thread_compaction_token_threshold,
+    keep_messages=settings.thread_compaction_keep_messages,
+)
+
+# Event-loop lag sampler feeding load shedding
+lag_monitor = LoopLagMonitor(interval=settings.loop_lag_sample_interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run n8n health probes and lag sampling in the background"""
+    background_tasks = [
+        asyncio.create_task(n8n_client.run_health_probes()),
+        asyncio.create_task(lag_monitor.run()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+
+
+# Initialize FastAPI app
+app = FastAPI(
+    title="ABAP Agent API (unified)",
+    description="Backend API for ABAP Code Generation via OpenAI and n8n with request hedging",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+
+# Configure CORS - allow all origins in development for Codespaces compatibility
+# Note: When using allow_origins=["*"], credentials must be False
+install_middlewares(
+    app,
+    lag_monitor,
+    allow_origins=["*"],
+    allow_credentials=False,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.include_router(router)
+
+
+# Request/Response Models
+class ChatRequest(BaseModel):
+    """Request model for chat endpoint"""
+
+    thread_id: Optional[str] = None
+    message: str
+    ricef_type: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    """Response model for chat endpoint"""
+
+    thread_id: str
+    message_id: str
+    content: str
+    role: str
+
+
+class UploadResponse(BaseModel):
+    """Response model for file upload, understood by both frontends"""
+
+    success: bool
+    filename: str
+    content: str
+    role: str = "assistant"
+    backend: str
+    hedged: bool
+    thread_id: Optional[str] = None
+    message_id: Optional[str] = None
+    validation_warnings: List[str] = []
+
+
+def circuit_open_response(error: CircuitOpenError) -> HTTPException:
+    """503 telling the client when a backend will accept calls again"""
+    return HTTPException(
+        status_code=503,
+        detail="No generation backend is currently available, please retry later",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+# API Endpoints
+@app.get("/")
+async def root():
+    """Health check endpoint"""
+    return {
+        "status": "healthy",
+        "service": "ABAP Agent API (unified)",
+        "version": "1.0.0",
+        "primary_backend": settings.unified_primary_backend,
+    }
+
+
+@app.get("/api/health")
+async def health_check():
+    """
+    Detailed health check with circuit state and hedge delay per backend.
+    Served from cached state, never calls an upstream inline.
+    """
+    n8n_health = n8n_client.cached_health()
+    return {
+        "status": "healthy",
+        "primary_backend": settings.unified_primary_backend,
+        "hedging_enabled": settings.hedge_enabled,
+        "backends": generator.snapshot(),
+        "n8n_reachable": n8n_health["reachable"],
+        "n8n_checked_at": n8n_health["checked_at"],
+    }
+
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    """
+    Follow-up conversation on an OpenAI thread (n8n has no conversations).
+    Long threads are compacted first: the returned thread_id may be a new one.
+    Fails fast with 503 while the OpenAI circuit is open.
+    """
+    try:
+        openai_breaker.before_call()
+    except CircuitOpenError as e:
+        raise circuit_open_response(e)
+
+    started = time.monotonic()
+    try:
+        thread_id = request.thread_id
+        if not thread_id:
+            thread_id = await openai_client.create_thread()
+        else:
+            thread_id = await thread_compactor.maybe_compact(thread_id)
+
+        async def generate():
+            await openai_client.add_message(thread_id, request.message)
+            return await openai_client.run_assistant(thread_id, request.ricef_type)
+
+        response = await cancel_on_disconnect(http_request, generate())
+        openai_breaker.record_success(time.monotonic() - started)
+        thread_compactor.record(thread_id, response["thread_tokens"])
+
+        return ChatResponse(
+            thread_id=thread_id,
+            message_id=response["message_id"],
+            content=response["content"],
+            role=response["role"],
+        )
+    except ClientDisconnected:
+        openai_breaker.release()
+        raise
+    except Exception as e:
+        openai_breaker.record_failure(time.monotonic() - started)
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+
+
+@app.post("/api/upload", response_model=UploadResponse)
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    thread_id: Optional[str] = Form(None),
+    message: Optional[str] = Form(None),
+    ricef_type: Optional[str] = Form(None),
+    primary: Optional[str] = Form(None),
+):
+    """
+    Upload a spec and generate ABAP code on the primary backend
+    (UNIFIED_PRIMARY_BACKEND, or the `primary` form field).
+    If the primary has not answered within its hedge delay, the other backend
+    is asked too and the first good result wins; the loser is cancelled.
+    With a thread_id, OpenAI continues that conversation (compacted first when
+    long) and the thread_id is returned whichever backend wins; an n8n answer
+    is recorded on the thread as an assistant message.
+    """
+    primary = primary or settings.unified_primary_backend
+    if primary not in generator.backends:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown backend '{primary}'. Expected one of: {', '.join(generator.backends)}",
+        )
+
+    try:
+        # Check, extract and validate the spec off the event loop
+        upload = await read_upload(file, ricef_type)
+
+        if thread_id:
+            thread_id = await thread_compactor.maybe_compact(thread_id)
+
+        generation = GenerationRequest(
+            file_content=upload.content,
+            filename=file.filename,
+            parsed_content=upload.text,
+            message=message,
+            ricef_type=ricef_type,
+            thread_id=thread_id,
+        )
+        with stage("hedged_generate"):
+            result = await cancel_on_disconnect(request, generator.generate(generation, primary))
+        if thread_id and result["backend"] != openai_backend.name:
+            # Keep the caller's conversation complete for its next turn
+            try:
+                result["message_id"] = await openai_backend.record_answer(
+                    generation, result["content"]
+                )
+            except Exception as e:
+                print(f"[WARN] Could not record the {result['backend']} answer on {thread_id}: {e}")
+        if result["thread_id"]:
+            thread_compactor.record(result["thread_id"], result["thread_tokens"])
+
+        return UploadResponse(
+            success=True,
+            filename=file.filename,
+            content=result["content"],
+            backend=result["backend"],
+            hedged=result["hedged"],
+            thread_id=result["thread_id"],
+            message_id=result["message_id"],
+            validation_warnings=upload.validation_warnings,
+        )
+    except CircuitOpenError as e:
+        raise circuit_open_response(e)
+    except BackendError as e:
+        raise HTTPException(status_code=502, detail=f"All backends failed: {str(e)}")
+    except (HTTPException, ClientDisconnected):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=settings.api_host, port=settings.api_port)
@@ -0,0 +1,462 @@
+"""
+Map-Reduce Generation
+Splits oversized specifications into parts, generates each part on its own
+thread concurrently, merges the results mechanically (shared declarations
+and routines once, clashing names prefixed per part) and consolidates the
+merged program in a final run
+"""
+import asyncio
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from config import settings
+from openai_client import OpenAIAssistantClient
+from profiling import stage
+from thread_compaction import spec_metadata
+from utils import extract_sheets_from_xlsx, load_json
+
+# Spec sections made of independent rows, in order of preference for splitting.
+# Other lists (change logs, test scenarios, ...) are context and never split.
+SPLIT_SECTIONS = (
+    "output_fields",
+    "segments",
+    "field_mappings",
+    "mapping_rules",
+    "target_fields",
+    "source_fields",
+    "direct_mappings",
+    "calculated_fields",
+    "data_fields",
+)
+
+# Statements declaring named objects, and all that make up the declaration
+# part at the top of a program
+NAMING_KEYWORDS = frozenset({
+    "TABLES", "TYPES", "DATA", "CONSTANTS", "STATICS", "FIELD-SYMBOLS",
+    "PARAMETERS", "SELECT-OPTIONS",
+})
+DECLARATION_KEYWORDS = NAMING_KEYWORDS | {"REPORT", "PROGRAM", "TYPE-POOLS", "SELECTION-SCREEN"}
+
+# Passes over one part while renaming names that clash with earlier parts
+MAX_RENAME_ROUNDS = 10
+
+_CODE_BLOCK = re.compile(r"```[ \t]*(?:abap)?[^\n]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+_NAME = re.compile(r"[A-Za-z_/][\w/-]*")
+
+
+class SpecPart(BaseModel):
+    """One independently generated slice of a specification"""
+
+    label: str
+    content: str
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False))
+
+
+def _pack(sizes: List[int], budget: int, max_parts: int) -> List[Tuple[int, int]]:
+    """
+    Group consecutive units into (start, end) ranges of about `budget` each.
+    The budget grows until at most `max_parts` ranges are needed.
+    """
+    budget = max(budget, math.ceil(sum(sizes) / max(max_parts, 1)), 1)
+    while True:
+        ranges: List[Tuple[int, int]] = []
+        start, used = 0, 0
+        for index, size in enumerate(sizes):
+            if index > start and used + size > budget:
+                ranges.append((start, index))
+                start, used = index, 0
+            used += size
+        ranges.append((start, len(sizes)))
+        if len(ranges) <= max_parts:
+            return ranges
+        budget += budget // 4 + 1
+
+
+def _section_lists(node: Any, path: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], List[Any]]]:
+    """Every SPLIT_SECTIONS list nested in dicts, with its key path"""
+    found = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if isinstance(value, list) and key in SPLIT_SECTIONS:
+                found.append((path + (key,), value))
+            else:
+                found.extend(_section_lists(value, path + (key,)))
+    return found
+
+
+def _with_list(spec: Dict[str, Any], path: Tuple[str, ...], items: List[Any]) -> Dict[str, Any]:
+    """Copy of spec with the list at path replaced; only dicts along the path are copied"""
+    root = dict(spec)
+    node = root
+    for key in path[:-1]:
+        node[key] = dict(node[key])
+        node = node[key]
+    node[path[-1]] = items
+    return root
+
+
+def partition_json_spec(spec: Any, budget: int, max_parts: int) -> List[SpecPart]:
+    """
+    Split a JSON spec larger than `budget` characters along its main section
+    list (report_details.output_fields, interface segments, field mappings).
+    Each part keeps the rest of the spec as context.
+    """
+    if not isinstance(spec, dict):
+        return []
+    total = _size(spec)
+    if total <= budget:
+        return []
+    sections = _section_lists(spec)
+    if not sections:
+        return []
+
+    # The earliest preferred section; the largest one when several share a key
+    path, items = min(
+        sections, key=lambda section: (SPLIT_SECTIONS.index(section[0][-1]), -_size(section[1]))
+    )
+    sizes = [_size(item) for item in items]
+    context = total - sum(sizes)
+    ranges = _pack(sizes, max(budget - context, budget // 2), max_parts)
+    if len(ranges) <= 1:
+        return []
+
+    dotted = ".".join(path)
+    return [
+        SpecPart(
+            label=f"{dotted} items {start + 1}-{end} of {len(items)}",
+            content=json.dumps(_with_list(spec, path, items[start:end]), indent=2, ensure_ascii=False),
+        )
+        for start, end in ranges
+    ]
+
+
+def partition_tables(tables: List[Tuple[str, str]], budget: int, max_parts: int) -> List[SpecPart]:
+    """Group workbook tables into parts of about `budget` characters"""
+    sizes = [len(table) for _, table in tables]
+    if sum(sizes) <= budget:
+        return []
+    ranges = _pack(sizes, budget, max_parts)
+    if len(ranges) <= 1:
+        return []
+    return [
+        SpecPart(
+            label=", ".join(label for label, _ in tables[start:end]),
+            content="\n\n".join(f"## {label}\n\n{table}" for label, table in tables[start:end]),
+        )
+        for start, end in ranges
+    ]
+
+
+def partition_spec(file_content: bytes, filename: str, spec: Any = None) -> List[SpecPart]:
+    """
+    Split an uploaded spec along its natural boundaries; `spec` is the parsed
+    JSON document when the caller already has it.
+    Returns an empty list when the spec fits in MAP_REDUCE_MIN_BYTES.
+    """
+    budget = settings.map_reduce_min_bytes
+    max_parts = settings.map_reduce_max_parts
+    if len(file_content) <= budget // 2:
+        # Far below the budget even after formatting, skip parsing
+        return []
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".json":
+        if spec is None:
+            spec = load_json(file_content)
+        return partition_json_spec(spec, budget, max_parts)
+    if ext == ".xlsx":
+        tables = extract_sheets_from_xlsx(file_content, settings.map_reduce_sheet_rows)
+        return partition_tables(tables, budget, max_parts)
+    return []
+
+
+def build_part_prompt(message: str, filename: str, part: SpecPart, index: int, total: int) -> str:
+    """Prompt for generating a single part"""
+    return (
+        f"{message}\n\nFile: {filename} (part {index} of {total}: {part.label})\n\n"
+        "This specification is too large for one generation and has been split. "
+        "Generate the ABAP code for this part only, as a single abap code block. "
+        "The parts are merged into one program afterwards: put all declarations "
+        "at the top and derive type, variable and routine names directly from "
+        "the specification.\n\n"
+        f"{part.content}"
+    )
+
+
+def _code(content: str) -> str:
+    """ABAP source of an assistant answer: its code blocks, or all of it"""
+    blocks = _CODE_BLOCK.findall(content)
+    return "\n".join(block.rstrip() for block in blocks) if blocks else content.strip()
+
+
+def _statements(source: str) -> List[str]:
+    """Split ABAP source into statements (text up to a period ending a line)"""
+    statements, current = [], []
+    for line in source.splitlines():
+        current.append(line)
+        stripped = line.strip()
+        if not stripped or stripped.startswith("*") or stripped.startswith('"'):
+            if len(current) == 1:
+                statements.append(line)
+                current = []
+            continue
+        if stripped.split('"', 1)[0].rstrip().endswith("."):
+            statements.append("\n".join(current))
+            current = []
+    if current:
+        statements.append("\n".join(current))
+    return statements
+
+
+def _keyword(statement: str) -> str:
+    stripped = statement.strip()
+    if not stripped or stripped[0] in '*"':
+        return ""
+    return stripped.split(None, 1)[0].rstrip(":.").upper()
+
+
+def _declared_names(statement: str) -> List[str]:
+    """Names declared by a (possibly chained) declaration statement"""
+    body = statement.strip().split(None, 1)
+    if len(body) < 2 or _keyword(statement) not in NAMING_KEYWORDS:
+        return []
+    names, depth = [], 0
+    for item in body[1].lstrip(":").rstrip(".").split(","):
+        words = item.split()
+        if len(words) >= 3 and words[0].upper() in ("BEGIN", "END") and words[1].upper() == "OF":
+            if words[0].upper() == "BEGIN":
+                if depth == 0:
+                    names.append(words[2].upper())
+                depth += 1
+            else:
+                depth = max(0, depth - 1)
+            continue
+        match = _NAME.match(item.strip())
+        if match and depth == 0:
+            names.append(match.group().upper())
+    return names
+
+
+def _normalized(statement: str) -> str:
+    return " ".join(statement.split()).upper()
+
+
+def _leading_declarations(statements: List[str]) -> int:
+    """Number of statements forming the declaration part at the top"""
+    split = 0
+    while split < len(statements) and (
+        _keyword(statements[split]) in DECLARATION_KEYWORDS or not _keyword(statements[split])
+    ):
+        split += 1
+    return split
+
+
+def _routines(statements: List[str]) -> List[Tuple[Tuple[str, str], int, int]]:
+    """((kind, name), start, end) of the FORM and CLASS blocks among statements"""
+    blocks = []
+    index = 0
+    while index < len(statements):
+        keyword = _keyword(statements[index])
+        words = [word.rstrip(".:").upper() for word in statements[index].split()]
+        if keyword == "FORM" and len(words) > 1:
+            kind, closing = "FORM", "ENDFORM"
+        elif (
+            keyword == "CLASS" and len(words) > 2
+            and words[2] in ("DEFINITION", "IMPLEMENTATION")
+            and not set(words[3:]) & {"DEFERRED", "LOAD"}
+        ):
+            kind, closing = f"CLASS {words[2]}", "ENDCLASS"
+        else:
+            index += 1
+            continue
+        end = index + 1
+        while end < len(statements) and _keyword(statements[end]) != closing:
+            end += 1
+        end = min(end + 1, len(statements))
+        blocks.append(((kind, words[1]), index, end))
+        index = end
+    return blocks
+
+
+def _part_name(name: str, index: int) -> str:
+    """Name of an object of part `index` that clashes with an earlier part (ABAP limit 30)"""
+    return f"p{index}_{name}"[:30]
+
+
+def _rename(source: str, names: List[str], index: int) -> str:
+    """Give `names` the part prefix wherever they occur in the source"""
+    pattern = re.compile(
+        r"(?<![\w/-])(" + "|".join(re.escape(name) for name in names) + r")(?![\w/])",
+        re.IGNORECASE,
+    )
+    return pattern.sub(lambda match: _part_name(match.group(), index), source)
+
+
+def merge_part_programs(parts: List[SpecPart], contents: List[str]) -> str:
+    """
+    Combine the programs generated for each part into one, mechanically.
+
+    Repeated declarations, FORM routines and local classes (with their
+    methods) are kept once. A name that a later part declares or implements
+    differently is prefixed with the part number throughout that part
+    (get_data -> p2_get_data), so every part keeps compiling against its own
+    definitions. The remaining code of every part follows in order under a
+    part header.
+    """
+    declarations: List[str] = []
+    seen_statements = set()
+    declared: Dict[str, str] = {}  # name -> declaring statement
+    defined: Dict[Tuple[str, str], str] = {}  # (kind, name) -> routine source
+    bodies: List[str] = []
+    program_seen = False
+
+    for index, (part, content) in enumerate(zip(parts, contents), start=1):
+        code = _code(content)
+        renamed = set()
+        # Renaming can make further statements differ (a DATA typed with a
+        # renamed TYPES), so repeat until the part agrees with earlier ones
+        for _ in range(MAX_RENAME_ROUNDS):
+            statements = _statements(code)
+            split = _leading_declarations(statements)
+            clashes = set()
+            for statement in statements[:split]:
+                for name in _declared_names(statement):
+                    if declared.get(name, _normalized(statement)) != _normalized(statement):
+                        clashes.add(name)
+            for key, start, end in _routines(statements[split:]):
+                source = _normalized("\n".join(statements[split + start:split + end]))
+                if defined.get(key, source) != source:
+                    clashes.add(key[1])
+            clashes -= renamed
+            if not clashes:
+                break
+            renamed |= clashes
+            code = _rename(code, sorted(clashes), index)
+
+        for statement in statements[:split]:
+            keyword = _keyword(statement)
+            if not keyword:
+                continue
+            if keyword in ("REPORT", "PROGRAM"):
+                if not program_seen:
+                    declarations.insert(0, statement.strip())
+                    program_seen = True
+                continue
+            key = _normalized(statement)
+            if key in seen_statements:
+                continue
+            seen_statements.add(key)
+            for name in _declared_names(statement):
+                declared.setdefault(name, key)
+            declarations.append(statement.strip())
+
+        body = statements[split:]
+        duplicates = set()
+        for key, start, end in _routines(body):
+            source = _normalized("\n".join(body[start:end]))
+            if key in defined:
+                duplicates.update(range(start, end))
+            else:
+                defined[key] = source
+        text = "\n".join(
+            statement for position, statement in enumerate(body) if position not in duplicates
+        ).strip()
+        if text:
+            bodies.append(f"*{'-' * 69}\n* Part {index} of {len(parts)}: {part.label}\n*{'-' * 69}\n{text}")
+
+    return ("\n".join(declarations) + "\n\n" + "\n\n".join(bodies)).strip()
+
+
+def build_merge_prompt(message: str, filename: str, parts: List[SpecPart], program: str) -> str:
+    """Prompt for the consolidation run over the mechanically merged program"""
+    labels = "\n".join(f"- Part {index}: {part.label}" for index, part in enumerate(parts, start=1))
+    return (
+        f"{message}\n\nFile: {filename}\n\n"
+        f"The specification was split into {len(parts)} parts that were generated "
+        f"separately:\n{labels}\n\n"
+        "They were combined mechanically below: repeated declarations and routines "
+        "are kept once, and names a later part defined differently carry a part "
+        "prefix (p2_, p3_, ...). Consolidate this into one coherent, complete ABAP "
+        "program: unify the per-part types, data and routines that serve the same "
+        "purpose, keep a single selection screen and processing flow, and return "
+        "the full program in one abap code block.\n\n"
+        f"```abap\n{program}\n```"
+    )
+
+
+async def generate_map_reduce(
+    client: OpenAIAssistantClient,
+    thread_id: str,
+    message: str,
+    filename: str,
+    parts: List[SpecPart],
+    ricef_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Generate every part on its own thread concurrently, merge the results
+    mechanically, then consolidate them in a final run on the caller's
+    thread so follow-up questions keep the final program.
+
+    The consolidation run gets MAP_REDUCE_MERGE_TIMEOUT to finish. When the
+    merged program is longer than MAP_REDUCE_MERGE_MAX_CHARS, or the run
+    fails, the mechanically merged program is the answer.
+    """
+    semaphore = asyncio.Semaphore(settings.map_reduce_concurrency)
+
+    async def generate_part(index: int, part: SpecPart) -> Dict[str, Any]:
+        async with semaphore:
+            part_thread_id = await client.create_thread()
+            await client.add_message(
+                part_thread_id, build_part_prompt(message, filename, part, index, len(parts))
+            )
+            return await client.run_assistant(part_thread_id, ricef_type)
+
+    tasks = [
+        asyncio.create_task(generate_part(index, part))
+        for index, part in enumerate(parts, start=1)
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One part failed or the request was cancelled: stop the others
+        for task in tasks:
+            task.cancel()
+        raise
+
+    program = merge_part_programs(parts, [result["content"] for result in results])
+    await client.add_message(
+        thread_id,
+        build_merge_prompt(message, filename, parts, program),
+        metadata=spec_metadata(filename, message),
+    )
+    if len(program) <= settings.map_reduce_merge_max_chars:
+        try:
+            with stage("map_reduce_consolidate"):
+                return await client.run_assistant(
+                    thread_id, ricef_type, max_wait=settings.map_reduce_merge_timeout
+                )
+        except Exception as e:
+            print(f"[WARN] Consolidation run failed, answering with the merged parts: {e}")
+
+    content = (
+        f"The specification was generated in {len(parts)} parts, merged into one program:\n\n"
+        f"```abap\n{program}\n```"
+    )
+    try:
+        message_id = await client.add_message(thread_id, content, role="assistant")
+    except Exception as e:
+        # A timed-out run may still be cancelling and block new messages
+        print(f"[WARN] Could not record the merged program on thread {thread_id}: {e}")
+        message_id = None
+    return {
+        "message_id": message_id,
+        "content": content,
+        "role": "assistant",
+        "thread_tokens": None,
+    }
@@ -0,0 +1,91 @@
+"""
+Metrics
+Minimal in-process counters and gauges rendered in Prometheus text format
+"""
+from typing import Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def get(self, **labels: str) -> float:
+        """Current value for the given label set"""
+        return self.values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> List[str]:
+        """Exposition lines for this metric"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values.items()):
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels)
+                lines.append(f"{self.name}{{{label_text}}} {value:g}")
+            else:
+                lines.append(f"{self.name} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        """Create or fetch a counter"""
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        """Create or fetch a gauge"""
+        return self._register(Gauge(name, help_text))
+
+    def _register(self, metric: _Metric):
+        # Registering the same name twice returns the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry, exposed at /metrics
+registry = MetricsRegistry()
@@ -2,9 +2,34 @@
 n8n Workflow Client
 Handles communication with n8n webhooks for ABAP code generation
 """
+import asyncio
+import codecs
+import json
+import time
 import httpx
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional
 from config import settings
+from circuit_breaker import CircuitBreaker
+from json_stream import JsonFieldStreamer
+from metrics import registry
+from profiling import stage
+
+calls_cancelled_counter = registry.counter(
+    "abap_n8n_calls_cancelled_total", "Workflow calls abandoned before n8n answered"
+)
+
+# Fields whose value is relayed to the client while the workflow response streams in.
+# Only the top-priority key of _extract_content: a value under any other key could
+# still be outranked by a later one, so those responses are buffered instead.
+STREAM_CONTENT_KEYS = ("abap_code",)
+
+
+class N8nWorkflowError(Exception):
+    """Raised by the streaming API when the workflow call fails"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        self.status_code = status_code
+        super().__init__(message)
 
 
 class N8nWorkflowClient:
@@ -13,6 +38,18 @@ class N8nWorkflowClient:
     def __init__(self):
         self.webhook_url = settings.n8n_webhook_url
         self.timeout = settings.n8n_timeout
+        self.breaker = CircuitBreaker(
+            "n8n",
+            failure_rate_threshold=settings.n8n_breaker_failure_rate,
+            slow_call_seconds=settings.n8n_breaker_slow_call_seconds,
+            slow_call_rate_threshold=settings.n8n_breaker_slow_call_rate,
+            window_size=settings.n8n_breaker_window_size,
+            min_calls=settings.n8n_breaker_min_calls,
+            open_seconds=settings.n8n_breaker_open_seconds,
+            probe_failures_to_open=settings.n8n_breaker_probe_failures,
+        )
+        # Result of the latest background probe, served by /api/health
+        self._health: Dict[str, Any] = {"reachable": None, "checked_at": None}
 
     async def send_file_to_workflow(
         self, 
@@ -30,7 +67,12 @@ class N8nWorkflowClient:
             
         Returns:
             Dict containing the workflow response
+
+        Raises:
+            CircuitOpenError: If the webhook is currently considered down
         """
+        self.breaker.before_call()
+
         # Prepare multipart form data
         files = {
             "file": (filename, file_content, self._get_content_type(filename))
@@ -39,58 +81,200 @@ class N8nWorkflowClient:
         # Add any additional form data
         data = additional_data or {}
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        started = time.monotonic()
+        timeout = httpx.Timeout(self.timeout, connect=settings.n8n_connect_timeout)
+        async with httpx.AsyncClient(timeout=timeout) as client:
             try:
-                response = await client.post(
-                    self.webhook_url,
-                    files=files,
-                    data=data
-                )
+                with stage("n8n_webhook"):
+                    response = await client.post(
+                        self.webhook_url,
+                        files=files,
+                        data=data
+                    )
                 response.raise_for_status()
+                self.breaker.record_success(time.monotonic() - started)
                 
-                # Try to parse as JSON, fallback to text
+                # Parse JSON responses (same rule as _relay_response), fallback to text
                 try:
+                    if not self._is_json(response):
+                        raise ValueError(f"content-type {response.headers.get('content-type')}")
                     result = response.json()
-                    print(f"[DEBUG] n8n raw response type: {type(result)}")
-                    print(f"[DEBUG] n8n raw response: {str(result)[:500]}")
+                    if settings.debug:
+                        print(f"[DEBUG] n8n raw response type: {type(result)}")
+                        print(f"[DEBUG] n8n raw response: {str(result)[:500]}")
                     
                     # Extract content from various possible response formats
                     content = self._extract_content(result)
-                    print(f"[DEBUG] Extracted content: {str(content)[:200]}")
+                    if settings.debug:
+                        print(f"[DEBUG] Extracted content: {str(content)[:200]}")
                     
-                    return {
-                        "success": True,
-                        "content": content,
-                        "raw_response": result
-                    }
+                    workflow_result = {"success": True, "content": content}
+                    if settings.debug:
+                        workflow_result["raw_response"] = result
+                    return workflow_result
                 except Exception as e:
-                    print(f"[DEBUG] JSON parse failed: {e}, using text")
+                    if settings.debug:
+                        print(f"[DEBUG] JSON parse failed: {e}, using text")
                     # Return as plain text if not JSON
-                    return {
-                        "success": True,
-                        "content": response.text,
-                        "raw_response": response.text
-                    }
+                    workflow_result = {"success": True, "content": response.text}
+                    if settings.debug:
+                        workflow_result["raw_response"] = response.text
+                    return workflow_result
                     
             except httpx.HTTPStatusError as e:
+                # 4xx means the request was rejected, not that n8n is down
+                if e.response.status_code >= 500:
+                    self.breaker.record_failure(time.monotonic() - started)
+                else:
+                    self.breaker.record_success(time.monotonic() - started)
                 return {
                     "success": False,
                     "error": f"HTTP {e.response.status_code}: {e.response.text}",
                     "content": f"Workflow returned error: {e.response.status_code}"
                 }
             except httpx.TimeoutException:
+                self.breaker.record_failure(time.monotonic() - started)
                 return {
                     "success": False,
                     "error": "Workflow timed out",
                     "content": f"The n8n workflow did not respond within {self.timeout} seconds"
                 }
+            except asyncio.CancelledError:
+                self.breaker.release()
+                calls_cancelled_counter.inc(mode="buffered")
+                raise
             except Exception as e:
+                self.breaker.record_failure(time.monotonic() - started)
                 return {
                     "success": False,
                     "error": str(e),
                     "content": f"Failed to connect to workflow: {str(e)}"
                 }
 
+    async def stream_file_to_workflow(
+        self,
+        file_content: bytes,
+        filename: str,
+        additional_data: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Send a file to the n8n workflow webhook and relay the response as it arrives.
+
+        JSON responses are scanned incrementally: a non-blank STREAM_CONTENT_KEYS
+        value of the root object is yielded chunk by chunk. Any other document
+        is buffered and goes through _extract_content once complete, so both
+        paths pick the same content. Non-JSON responses are passed through as
+        plain text.
+
+        Raises:
+            CircuitOpenError: If the webhook is currently considered down
+            N8nWorkflowError: If the workflow fails before any output is produced
+        """
+        self.breaker.before_call()
+
+        files = {
+            "file": (filename, file_content, self._get_content_type(filename))
+        }
+        data = additional_data or {}
+
+        started = time.monotonic()
+        outcome_recorded = False
+        timeout = httpx.Timeout(self.timeout, connect=settings.n8n_connect_timeout)
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                try:
+                    async with client.stream(
+                        "POST", self.webhook_url, files=files, data=data
+                    ) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            if response.status_code >= 500:
+                                self.breaker.record_failure(time.monotonic() - started)
+                            else:
+                                self.breaker.record_success(time.monotonic() - started)
+                            outcome_recorded = True
+                            raise N8nWorkflowError(
+                                f"Workflow returned error: {response.status_code}",
+                                status_code=502,
+                            )
+
+                        async for chunk in self._relay_response(response):
+                            yield chunk
+                except httpx.TimeoutException:
+                    self.breaker.record_failure(time.monotonic() - started)
+                    outcome_recorded = True
+                    raise N8nWorkflowError(
+                        f"The n8n workflow did not respond within {self.timeout} seconds",
+                        status_code=504,
+                    )
+                except httpx.HTTPError as e:
+                    self.breaker.record_failure(time.monotonic() - started)
+                    outcome_recorded = True
+                    raise N8nWorkflowError(f"Failed to connect to workflow: {str(e)}")
+
+            self.breaker.record_success(time.monotonic() - started)
+            outcome_recorded = True
+        finally:
+            # Client went away mid-stream: no verdict on the upstream
+            if not outcome_recorded:
+                self.breaker.release()
+                calls_cancelled_counter.inc(mode="stream")
+
+    async def _relay_response(self, response: httpx.Response) -> AsyncIterator[str]:
+        """Yield the useful part of a streaming webhook response as text chunks"""
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        streamer: Optional[JsonFieldStreamer] = None
+        # Body kept until a content value is known to win, for the _extract_content fallback
+        pending: Optional[List[str]] = None
+        passthrough = not self._is_json(response)
+
+        async for raw in response.aiter_bytes():
+            text = decoder.decode(raw)
+            if not text:
+                continue
+            if passthrough:
+                yield text
+                continue
+
+            if streamer is None:
+                stripped = text.lstrip()
+                if not stripped:
+                    continue
+                if stripped[0] not in '{["':
+                    passthrough = True
+                    yield text
+                    continue
+                streamer = JsonFieldStreamer(STREAM_CONTENT_KEYS)
+                pending = []
+
+            if pending is not None:
+                pending.append(text)
+            content = streamer.feed(text)
+            if streamer.started:
+                pending = None
+            if content:
+                yield content
+            if streamer.finished:
+                return
+
+        tail = decoder.decode(b"", final=True)
+        if passthrough:
+            if tail:
+                yield tail
+            return
+        if pending is not None:
+            pending.append(tail)
+            body = "".join(pending)
+            try:
+                yield self._extract_content(json.loads(body))
+            except ValueError:
+                yield body
+
+    @staticmethod
+    def _is_json(response: httpx.Response) -> bool:
+        """Whether a webhook response is parsed as JSON rather than used as text"""
+        return "json" in response.headers.get("content-type", "")
+
     def _extract_content(self, result: Any) -> str:
         """
         Recursively extract content from n8n response.
@@ -150,3 +334,26 @@ class N8nWorkflowClient:
                 return response.status_code < 500
             except Exception:
                 return False
+
+    async def run_health_probes(self) -> None:
+        """
+        Probe the webhook in the background and cache the result.
+        Probes drive the circuit breaker without entering its call window:
+        repeated failures open it so uploads fail fast even before any real
+        traffic has hit a dead webhook, and a success closes it again.
+        """
+        while True:
+            started = time.monotonic()
+            reachable = await self.health_check()
+            latency = time.monotonic() - started
+            self.breaker.record_probe(reachable)
+            self._health = {
+                "reachable": reachable,
+                "checked_at": int(time.time()),
+                "latency_ms": int(latency * 1000),
+            }
+            await asyncio.sleep(settings.n8n_health_probe_interval)
+
+    def cached_health(self) -> Dict[str, Any]:
+        """Latest probe result plus the current circuit state"""
+        return {**self._health, "circuit": self.breaker.snapshot()}
@@ -7,6 +7,16 @@ import time
 from typing import Optional, List, Dict, Any
 from openai import AsyncOpenAI
 from config import settings, get_assistant_id
+from ddic import DDIC, DDIC_INSTRUCTIONS, DDIC_TOOL_NAMES, DDIC_TOOLS
+from metrics import registry
+from profiling import stage
+
+runs_cancelled_counter = registry.counter(
+    "abap_openai_runs_cancelled_total", "Assistant runs cancelled before completion"
+)
+
+# Run states that block new messages on the thread
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
 
 
 class OpenAIAssistantClient:
@@ -15,29 +25,46 @@ class OpenAIAssistantClient:
     def __init__(self):
         self.client = AsyncOpenAI(api_key=settings.openai_api_key)
         self.default_assistant_id = settings.openai_assistant_id
+        # Local data dictionary answering function tool calls (None = no tools)
+        self.ddic = DDIC
+        # Assistant's own tools plus the DDIC functions, per assistant ID
+        self._run_tools: Dict[str, List[Dict[str, Any]]] = {}
 
-    async def create_thread(self) -> str:
-        """Create a new conversation thread"""
-        thread = await self.client.beta.threads.create()
+    async def create_thread(self, messages: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Create a new conversation thread, optionally seeded with messages"""
+        with stage("openai_create_thread"):
+            if messages:
+                thread = await self.client.beta.threads.create(messages=messages)
+            else:
+                thread = await self.client.beta.threads.create()
         return thread.id
 
     async def add_message(
-        self, thread_id: str, content: str, file_ids: Optional[List[str]] = None
+        self,
+        thread_id: str,
+        content: str,
+        file_ids: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, str]] = None,
+        role: str = "user",
     ) -> str:
-        """Add a message to a thread"""
+        """Add a message to a thread; role "assistant" records an answer produced elsewhere"""
         message_params = {
             "thread_id": thread_id,
-            "role": "user",
+            "role": role,
             "content": content,
         }
 
+        if metadata:
+            message_params["metadata"] = metadata
+
         if file_ids:
             message_params["attachments"] = [
                 {"file_id": file_id, "tools": [{"type": "file_search"}]}
                 for file_id in file_ids
             ]
 
-        message = await self.client.beta.threads.messages.create(**message_params)
+        with stage("openai_add_message"):
+            message = await self.client.beta.threads.messages.create(**message_params)
         return message.id
 
     async def upload_file(self, file_content: bytes, filename: str) -> str:
@@ -48,49 +75,44 @@ class OpenAIAssistantClient:
         return file_response.id
 
     async def run_assistant(
-        self, thread_id: str, ricef_type: Optional[str] = None
+        self, thread_id: str, ricef_type: Optional[str] = None, max_wait: int = 60
     ) -> Dict[str, Any]:
         """
-        Run the assistant on a thread and wait for completion
-        Returns the assistant's response
+        Run the assistant on a thread and wait up to about `max_wait` seconds
+        for completion. Returns the assistant's response
         """
         assistant_id = get_assistant_id(ricef_type)
 
+        run_params = {"thread_id": thread_id, "assistant_id": assistant_id}
+        tools = await self._tools_for(assistant_id)
+        if tools:
+            run_params["tools"] = tools
+            run_params["additional_instructions"] = DDIC_INSTRUCTIONS
+        if settings.thread_truncation_last_messages > 0:
+            # Only the most recent messages are sent to the model
+            run_params["truncation_strategy"] = {
+                "type": "last_messages",
+                "last_messages": settings.thread_truncation_last_messages,
+            }
+
         # Create a run
-        run = await self.client.beta.threads.runs.create(
-            thread_id=thread_id, assistant_id=assistant_id
-        )
+        with stage("openai_run_create"):
+            run = await self.client.beta.threads.runs.create(**run_params)
 
         # Poll for completion
-        max_attempts = 60  # 60 seconds timeout
-        attempt = 0
-
-        while attempt < max_attempts:
-            run_status = await self.client.beta.threads.runs.retrieve(
-                thread_id=thread_id, run_id=run.id
-            )
-
-            if run_status.status == "completed":
-                break
-            elif run_status.status == "requires_action":
-                # If the assistant requires tool calls, we should handle them or fail gracefully
-                # For now, we'll just fail since no tools are implemented yet
-                raise Exception(f"Run requires action: {run_status.required_action}")
-            elif run_status.status in ["failed", "cancelled", "expired"]:
-                error_msg = getattr(run_status, "last_error", "Unknown error")
-                raise Exception(f"Run {run_status.status}: {error_msg}")
-            
-            # Continue polling for queued or in_progress
-            await asyncio.sleep(1)
-            attempt += 1
-
-        if attempt >= max_attempts:
-            raise Exception("Assistant response timeout")
+        try:
+            with stage("openai_run_poll"):
+                run_status, tool_rounds = await self._wait_for_run(thread_id, run.id, max_wait)
+        except asyncio.CancelledError:
+            # Caller gave up (client disconnected): stop the run consuming tokens
+            await self.cancel_run(thread_id, run.id, reason="disconnect")
+            raise
 
         # Get the assistant's messages
-        messages = await self.client.beta.threads.messages.list(
-            thread_id=thread_id, order="desc", limit=1
-        )
+        with stage("openai_messages_list"):
+            messages = await self.client.beta.threads.messages.list(
+                thread_id=thread_id, order="desc", limit=1
+            )
 
         if not messages.data:
             raise Exception("No response from assistant")
@@ -108,14 +130,138 @@ class OpenAIAssistantClient:
             "content": response_text,
             "role": message.role,
             "created_at": message.created_at,
+            # Tokens the thread costs per run from now on (prompt + this answer)
+            "thread_tokens": await self._thread_tokens(thread_id, run_status, tool_rounds),
         }
 
+    async def _thread_tokens(self, thread_id: str, run, tool_rounds: int) -> Optional[int]:
+        """
+        Size of the thread after a run, from the usage of its final model call.
+        run.usage sums every call of the run, so after tool calls (one model
+        call per round) the last run step's usage is read instead.
+        None when unknown.
+        """
+        if run.usage is None:
+            return None
+        if not tool_rounds:
+            return run.usage.total_tokens
+        try:
+            steps = await self.client.beta.threads.runs.steps.list(
+                thread_id=thread_id, run_id=run.id, order="desc", limit=1
+            )
+        except Exception as e:
+            print(f"Error reading steps of run {run.id}: {e}")
+            return None
+        if not steps.data or steps.data[0].usage is None:
+            return None
+        return steps.data[0].usage.total_tokens
+
+    async def _tools_for(self, assistant_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Tools for a run: passing tools replaces the assistant's own, so they are
+        fetched once per assistant and merged with the DDIC functions.
+        """
+        if self.ddic is None:
+            return None
+        tools = self._run_tools.get(assistant_id)
+        if tools is None:
+            try:
+                assistant = await self.client.beta.assistants.retrieve(assistant_id)
+            except Exception as e:
+                print(f"Error loading tools of assistant {assistant_id}, running without DDIC tools: {e}")
+                return None
+            tools = [
+                tool.model_dump(exclude_none=True)
+                for tool in assistant.tools
+                if not (tool.type == "function" and tool.function.name in DDIC_TOOL_NAMES)
+            ] + DDIC_TOOLS
+            self._run_tools[assistant_id] = tools
+        return tools
+
+    async def _submit_tool_outputs(self, thread_id: str, run_id: str, required_action) -> None:
+        """Answer the run's function calls from the local DDIC and continue the run"""
+        if self.ddic is None or required_action is None or required_action.type != "submit_tool_outputs":
+            raise Exception(f"Run requires action: {required_action}")
+        with stage("ddic_tools"):
+            tool_outputs = [
+                {
+                    "tool_call_id": call.id,
+                    "output": self.ddic.call_tool(call.function.name, call.function.arguments),
+                }
+                for call in required_action.submit_tool_outputs.tool_calls
+            ]
+        with stage("openai_submit_tool_outputs"):
+            await self.client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs
+            )
+
+    async def _wait_for_run(self, thread_id: str, run_id: str, max_attempts: int = 60):
+        """
+        Poll a run until it completes.
+        Returns the completed run and how many rounds of tool calls it made.
+        """
+        attempt = 0  # one attempt per second
+        tool_rounds = 0
+
+        while attempt < max_attempts:
+            run_status = await self.client.beta.threads.runs.retrieve(
+                thread_id=thread_id, run_id=run_id
+            )
+
+            if run_status.status == "completed":
+                return run_status, tool_rounds
+            elif run_status.status == "requires_action":
+                # Function tool calls (DDIC lookups) are answered locally
+                await self._submit_tool_outputs(thread_id, run_id, run_status.required_action)
+                tool_rounds += 1
+                attempt += 1
+                continue
+            elif run_status.status in ["failed", "cancelled", "expired"]:
+                error_msg = getattr(run_status, "last_error", "Unknown error")
+                raise Exception(f"Run {run_status.status}: {error_msg}")
+        
+            # Continue polling for queued or in_progress
+            await asyncio.sleep(1)
+            attempt += 1
+
+        await self.cancel_run(thread_id, run_id, reason="timeout")
+        raise Exception("Assistant response timeout")
+
+    async def cancel_run(self, thread_id: str, run_id: str, reason: str) -> bool:
+        """
+        Cancel a run server-side.
+        Shielded so the request is still sent while the caller is being cancelled.
+        """
+        try:
+            await asyncio.shield(
+                self.client.beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
+            )
+        except Exception as e:
+            print(f"Error cancelling run {run_id}: {e}")
+            return False
+        runs_cancelled_counter.inc(reason=reason)
+        return True
+
+    async def wait_for_idle(self, thread_id: str, max_attempts: int = 10) -> bool:
+        """
+        Wait until the thread's latest run has settled, e.g. finished
+        cancelling, so messages can be added again. Returns False on timeout.
+        """
+        for _ in range(max_attempts):
+            runs = await self.client.beta.threads.runs.list(
+                thread_id=thread_id, order="desc", limit=1
+            )
+            if not runs.data or runs.data[0].status not in ACTIVE_RUN_STATUSES:
+                return True
+            await asyncio.sleep(1)
+        return False
+
     async def get_thread_messages(
-        self, thread_id: str, limit: int = 50
+        self, thread_id: str, limit: int = 50, order: str = "asc"
     ) -> List[Dict[str, Any]]:
         """Get all messages from a thread"""
         messages = await self.client.beta.threads.messages.list(
-            thread_id=thread_id, order="asc", limit=limit
+            thread_id=thread_id, order=order, limit=limit
         )
 
         formatted_messages = []
@@ -131,11 +277,25 @@ class OpenAIAssistantClient:
                     "role": message.role,
                     "content": content,
                     "created_at": message.created_at,
+                    "metadata": dict(message.metadata or {}),
                 }
             )
 
         return formatted_messages
 
+    async def summarize(self, instructions: str, text: str) -> str:
+        """One-shot chat completion used to condense old conversation turns"""
+        with stage("openai_summarize"):
+            completion = await self.client.chat.completions.create(
+                model=settings.thread_summary_model,
+                messages=[
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": text},
+                ],
+                max_tokens=settings.thread_summary_max_tokens,
+            )
+        return completion.choices[0].message.content or ""
+
     async def delete_file(self, file_id: str) -> bool:
         """Delete a file from OpenAI"""
         try:
@@ -0,0 +1,167 @@
+"""
+Profiling
+On-demand sampling profiler and per-request stage timings (Server-Timing)
+"""
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from fastapi import Header, HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+# Header that asks for a per-request trace (requires a valid admin token)
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+_NO_TRACE = nullcontext()
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+_profile_lock = threading.Lock()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether token matches the configured admin token"""
+    return bool(settings.admin_token) and bool(token) and secrets.compare_digest(
+        token, settings.admin_token
+    )
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    FastAPI dependency guarding admin endpoints.
+    Answers 404 when no admin token is configured so the surface is invisible.
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class RequestTrace:
+    """Accumulated duration and call count per stage for one request"""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+        self.started = time.perf_counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add one timed occurrence of a stage"""
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, stages in order of first use"""
+        metrics = []
+        for name, (seconds, calls) in self.stages.items():
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if calls > 1:
+                metric += f';desc="{calls} calls"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: RequestTrace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def stage(name: str):
+    """
+    Time a block as a named stage of the current request trace:
+
+        with stage("openai_run_poll"):
+            ...
+
+    Without an active trace this returns a shared no-op context manager.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_TRACE
+    return _Stage(trace, name)
+
+
+class ProfilingMiddleware:
+    """
+    Enable a RequestTrace for requests carrying X-Profile plus a valid
+    X-Admin-Token, and report its stages in a Server-Timing header.
+    Only installed when ADMIN_TOKEN is set.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if PROFILE_HEADER not in headers or not is_admin(headers.get(ADMIN_TOKEN_HEADER)):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float) -> str:
+    """
+    Sample the stacks of all other threads for `seconds` and return them in
+    collapsed format ("thread;outer;...;inner count"), ready for flamegraph.pl
+    or speedscope. Coroutines suspended in await do not appear: the samples
+    show where threads, including the event loop, actually spend CPU time.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        own_id = threading.get_ident()
+        counts: StackCounter = StackCounter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels: List[str] = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                counts[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+    finally:
+        _profile_lock.release()
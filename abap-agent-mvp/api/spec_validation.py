@@ -0,0 +1,237 @@
+"""
+Specification Pre-Validation
+Checks uploaded specs against validators compiled from the RICEF templates
+before any LLM or workflow call is made
+"""
+import glob
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from config import settings
+from utils import load_json
+
+Path = Tuple[str, ...]
+
+# Sections that must carry real content for a generation to be worthwhile
+REQUIRED_CONTENT: Dict[str, List[Path]] = {
+    "report": [("report_details", "output_fields")],
+    "interface": [("interface_details", "data_mapping", "field_mappings")],
+    "conversion": [("conversion_details", "target_data", "target_fields")],
+    "enhancement": [("enhancement_details", "business_requirement", "requirement_description")],
+    "form": [("form_details", "form_elements", "data_fields")],
+}
+
+
+class SpecValidationReport(BaseModel):
+    """Outcome of validating one specification"""
+
+    valid: bool
+    ricef_type: Optional[str] = None
+    errors: List[str] = []
+    warnings: List[str] = []
+
+
+def is_blank(value: Any) -> bool:
+    """True for values that carry no information; boolean flags are ignored"""
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, dict):
+        return all(is_blank(v) for v in value.values() if not isinstance(v, bool))
+    if isinstance(value, list):
+        return all(is_blank(item) for item in value)
+    return False
+
+
+def _lookup(spec: Any, path: Path) -> Tuple[bool, Any]:
+    """Follow a key path through nested dicts; returns (found, value)"""
+    node = spec
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            return False, None
+        node = node[key]
+    return True, node
+
+
+def _dotted(path: Path) -> str:
+    return ".".join(path)
+
+
+class CompiledValidator:
+    """
+    Validator for one RICEF type, compiled once from its template.
+
+    The template is flattened into fixed tuples of key paths so validating a
+    spec is a handful of dict lookups with no recursion over the template.
+    """
+
+    def __init__(self, ricef_type: str, template: Dict[str, Any]):
+        self.ricef_type = ricef_type
+        self.details_key = next(
+            (key for key in template if key.endswith("_details")), f"{ricef_type}_details"
+        )
+
+        containers: List[Tuple[Path, type]] = []
+        example_lists: List[Path] = []
+        # Sample row of each illustrated list, to spot rows left as in the template
+        self.example_rows: Dict[Path, Any] = {}
+
+        def collect(node: Any, path: Path) -> None:
+            if isinstance(node, dict):
+                if path:
+                    containers.append((path, dict))
+                for key, value in node.items():
+                    collect(value, path + (key,))
+            elif isinstance(node, list):
+                containers.append((path, list))
+                if node:
+                    example_lists.append(path)
+                    self.example_rows[path] = node[0]
+
+        collect(template, ())
+        self.required: Tuple[Path, ...] = tuple(REQUIRED_CONTENT.get(ricef_type, ()))
+        self.containers: Tuple[Tuple[Path, type], ...] = tuple(containers)
+        # Lists the template illustrates with a sample row: flag them if left blank
+        self.recommended: Tuple[Path, ...] = tuple(
+            path for path in example_lists if path not in self.required
+        )
+
+    def _unfilled(self, path: Path, value: Any) -> bool:
+        if is_blank(value):
+            return True
+        if isinstance(value, list) and path in self.example_rows:
+            example = self.example_rows[path]
+            return all(item == example or is_blank(item) for item in value)
+        return False
+
+    def validate(self, spec: Dict[str, Any], report: SpecValidationReport) -> None:
+        details = spec.get(self.details_key)
+        if not isinstance(details, dict) or is_blank(details):
+            report.errors.append(f"Missing or empty section '{self.details_key}'")
+            return
+
+        for path, expected in self.containers:
+            found, value = _lookup(spec, path)
+            if found and value is not None and not isinstance(value, expected):
+                kind = "an object" if expected is dict else "an array"
+                report.errors.append(f"'{_dotted(path)}' must be {kind}")
+
+        for path in self.required:
+            found, value = _lookup(spec, path)
+            if not found or self._unfilled(path, value):
+                report.errors.append(f"'{_dotted(path)}' is missing or empty")
+
+        for path in self.recommended:
+            found, value = _lookup(spec, path)
+            if found and isinstance(value, list) and value and self._unfilled(path, value):
+                report.warnings.append(f"'{_dotted(path)}' still contains only the blank template row")
+
+    def describe(self) -> Dict[str, Any]:
+        """Serializable form of the compiled rules"""
+        return {
+            "ricef_type": self.ricef_type,
+            "details_section": self.details_key,
+            "required": [_dotted(path) for path in self.required],
+            "recommended": [_dotted(path) for path in self.recommended],
+            "structure": {
+                _dotted(path): ("object" if kind is dict else "array")
+                for path, kind in self.containers
+            },
+        }
+
+
+def load_validators(templates_dir: str) -> Dict[str, CompiledValidator]:
+    """Compile a validator for every *_template.json in the templates directory"""
+    validators: Dict[str, CompiledValidator] = {}
+    for template_path in sorted(glob.glob(os.path.join(templates_dir, "*_template.json"))):
+        with open(template_path, "r", encoding="utf-8") as f:
+            template = json.load(f)
+        ricef_type = str(template.get("ricef_type", "")).lower() or (
+            os.path.basename(template_path).split("_")[0]
+        )
+        validators[ricef_type] = CompiledValidator(ricef_type, template)
+    if not validators:
+        print(f"[WARN] No RICEF templates found in {templates_dir}, spec structure is not validated")
+    return validators
+
+
+# Compiled once at import time
+VALIDATORS: Dict[str, CompiledValidator] = load_validators(settings.templates_dir)
+
+
+def validate_spec(spec: Any, ricef_type: Optional[str] = None) -> SpecValidationReport:
+    """Validate a parsed JSON specification"""
+    report = SpecValidationReport(valid=True)
+    if not isinstance(spec, dict):
+        report.errors.append("Specification must be a JSON object")
+    elif not spec or is_blank(spec):
+        report.errors.append("Specification is empty")
+    else:
+        spec_type = str(spec.get("ricef_type") or "").strip().lower()
+        hint_type = (ricef_type or "").strip().lower()
+        if spec_type and hint_type and spec_type != hint_type:
+            report.warnings.append(
+                f"ricef_type '{spec_type}' in the file differs from requested '{hint_type}'"
+            )
+        report.ricef_type = spec_type or hint_type or None
+
+        validator = VALIDATORS.get(report.ricef_type) if report.ricef_type else None
+        if validator:
+            validator.validate(spec, report)
+        elif report.ricef_type and VALIDATORS:
+            report.errors.append(
+                f"Unknown ricef_type '{report.ricef_type}'. Expected one of: {', '.join(VALIDATORS)}"
+            )
+        else:
+            report.warnings.append("No ricef_type given, specification structure was not validated")
+
+    report.valid = not report.errors
+    return report
+
+
+def validate_upload(
+    file_content: bytes,
+    filename: str,
+    parsed_content: Optional[str] = None,
+    ricef_type: Optional[str] = None,
+    spec: Any = None,
+) -> SpecValidationReport:
+    """
+    Validate an uploaded spec file.
+    JSON files are checked structurally; other types only for usable content.
+    `parsed_content` is the extracted text and `spec` the parsed JSON document
+    when the caller already has them.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if not file_content.strip():
+        return SpecValidationReport(valid=False, errors=["File is empty"])
+
+    if ext == ".json":
+        if spec is not None:
+            return validate_spec(spec, ricef_type)
+        try:
+            spec = load_json(file_content)
+        except ValueError as e:
+            return SpecValidationReport(valid=False, errors=[f"Invalid JSON: {str(e)}"])
+        return validate_spec(spec, ricef_type)
+
+    report = SpecValidationReport(valid=True, ricef_type=ricef_type)
+    if parsed_content is not None:
+        if not parsed_content.strip():
+            report.errors.append("File contains no readable content")
+        elif ext == ".xlsx" and not parsed_content.startswith("|"):
+            # extract_text_from_xlsx returns a message instead of a table on failure
+            report.errors.append(parsed_content)
+    report.valid = not report.errors
+    return report
+
+
+def templates_catalog() -> Dict[str, Any]:
+    """Compiled validators for all RICEF types, as served by /api/templates"""
+    return {
+        "ricef_types": sorted(VALIDATORS),
+        "validators": {name: validator.describe() for name, validator in sorted(VALIDATORS.items())},
+    }
@@ -0,0 +1,10 @@
+"""
+Unit test setup: make the api modules importable and give the settings the
+values they require (no real OpenAI or n8n calls are made)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("OPENAI_ASSISTANT_ID", "asst_test")
@@ -0,0 +1,24 @@
+"""Tests for the routes and middlewares shared by every app"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import main_n8n
+import main_unified
+
+
+@pytest.mark.parametrize("module", [main, main_n8n, main_unified])
+def test_shared_routes_are_served(module):
+    client = TestClient(module.app)
+    assert client.get("/metrics").status_code == 200
+
+    templates = client.get("/api/templates")
+    assert templates.status_code == 200
+    cached = client.get("/api/templates", headers={"If-None-Match": templates.headers["etag"]})
+    assert cached.status_code == 304
+
+
+@pytest.mark.parametrize("module", [main, main_n8n, main_unified])
+def test_profile_is_hidden_without_admin_token(module, monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "")
+    assert TestClient(module.app).post("/api/admin/profile").status_code == 404
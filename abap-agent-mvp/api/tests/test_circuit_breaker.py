@@ -0,0 +1,36 @@
+"""Tests for health probes driving the circuit breaker"""
+from circuit_breaker import CircuitBreaker
+
+
+def breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", min_calls=2, open_seconds=0, probe_failures_to_open=3)
+
+
+def test_occasional_probe_failures_keep_the_circuit_closed():
+    cb = breaker()
+    for _ in range(10):
+        cb.record_probe(False)
+        cb.record_probe(True)
+    assert cb.state == CircuitBreaker.CLOSED
+    assert cb.snapshot()["calls"] == 0
+
+
+def test_probes_stay_out_of_the_call_window():
+    cb = breaker()
+    cb.record_failure()
+    for _ in range(5):
+        cb.record_probe(True)
+    cb.record_failure()
+    assert cb._state == CircuitBreaker.OPEN
+
+
+def test_consecutive_probe_failures_open_and_a_success_closes():
+    cb = CircuitBreaker("test", open_seconds=60, probe_failures_to_open=3)
+    for _ in range(3):
+        cb.record_probe(False)
+    assert cb.state == CircuitBreaker.OPEN
+
+    cb.open_seconds = 0
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    cb.record_probe(True)
+    assert cb.state == CircuitBreaker.CLOSED
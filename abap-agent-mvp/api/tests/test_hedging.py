@@ -0,0 +1,95 @@
+"""Tests for hedged generation backends"""
+import asyncio
+
+from circuit_breaker import CircuitBreaker
+from hedging import GenerationRequest, HedgedGenerator, N8nBackend, OpenAIBackend
+
+REQUEST = GenerationRequest(
+    file_content=b"{}", filename="spec.json", parsed_content="{}", thread_id="thread_caller"
+)
+
+
+class FakeAssistantClient:
+    def __init__(self, run_seconds=0.0):
+        self.run_seconds = run_seconds
+        self.threads = []
+        self.events = []
+
+    async def create_thread(self):
+        raise AssertionError("caller's thread should be continued")
+
+    async def add_message(self, thread_id, content, metadata=None, role="user"):
+        self.threads.append(thread_id)
+        self.events.append(f"{role}: {content.splitlines()[0]}")
+        return f"msg_{len(self.events)}"
+
+    async def run_assistant(self, thread_id, ricef_type=None):
+        try:
+            await asyncio.sleep(self.run_seconds)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.01)  # the run is cancelled server-side
+            self.events.append("run cancelled")
+            raise
+        return {"content": "REPORT zai.", "message_id": "msg_1", "thread_tokens": 42}
+
+    async def wait_for_idle(self, thread_id):
+        return True
+
+
+class FakeWorkflowClient:
+    def __init__(self):
+        self.breaker = CircuitBreaker("n8n")
+
+    async def send_file_to_workflow(self, file_content, filename, additional_data=None):
+        return {"success": True, "content": "REPORT zflow."}
+
+
+def test_openai_continues_the_callers_thread():
+    client = FakeAssistantClient()
+    backend = OpenAIBackend(client, CircuitBreaker("openai"))
+    result = asyncio.run(backend.generate(REQUEST.model_copy()))
+    assert client.threads == ["thread_caller"]
+    assert result["thread_id"] == "thread_caller"
+    assert result["thread_tokens"] == 42
+
+
+def test_n8n_win_keeps_the_callers_thread():
+    generator = HedgedGenerator([N8nBackend(FakeWorkflowClient())], enabled=False)
+    result = asyncio.run(generator.generate(REQUEST, "n8n"))
+    assert result["backend"] == "n8n"
+    assert result["thread_id"] == "thread_caller"
+    assert result["content"] == "REPORT zflow."
+
+
+def race(primary):
+    """Hedged generation on the caller's thread, recorded the way main_unified does"""
+    client = FakeAssistantClient(run_seconds=10)
+    openai_backend = OpenAIBackend(client, CircuitBreaker("openai"))
+    generator = HedgedGenerator(
+        [openai_backend, N8nBackend(FakeWorkflowClient())], min_delay=0.01, default_delay=0.01
+    )
+    request = REQUEST.model_copy()
+
+    async def generate():
+        result = await generator.generate(request, primary)
+        result["message_id"] = await openai_backend.record_answer(request, result["content"])
+        return result
+
+    return asyncio.run(generate()), client.events
+
+
+def test_hedged_n8n_win_is_recorded_after_the_cancelled_run():
+    result, events = race("openai")
+    assert result["hedged"] and result["backend"] == "n8n"
+    assert events == [
+        "user: I've uploaded a file for processing.",
+        "run cancelled",
+        "assistant: REPORT zflow.",
+    ]
+    assert result["message_id"] == "msg_3"
+
+
+def test_n8n_answer_is_recorded_after_the_spec():
+    result, events = race("n8n")
+    assert not result["hedged"]
+    assert events == ["user: I've uploaded a file for processing.", "assistant: REPORT zflow."]
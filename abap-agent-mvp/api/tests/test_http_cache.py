@@ -0,0 +1,47 @@
+"""Tests for ETags on compressed responses"""
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware
+from http_cache import encoded_etag, etag_matches, strong_etag
+
+BODY = b"REPORT zcache.\n" * 200
+ETAG = strong_etag(BODY)
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get("/program")
+async def program(request: Request):
+    if etag_matches(request.headers.get("if-none-match"), ETAG):
+        return Response(status_code=304, headers={"ETag": ETAG})
+    return Response(content=BODY, media_type="text/plain", headers={"ETag": ETAG})
+
+
+client = TestClient(app)
+
+
+def test_compressed_response_has_encoding_specific_etag():
+    response = client.get("/program", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == encoded_etag(ETAG, "gzip") != ETAG
+
+
+def test_identity_response_keeps_plain_etag():
+    response = client.get("/program", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == ETAG
+
+
+def test_revalidating_compressed_etag_returns_same_tag():
+    etag = client.get("/program", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    response = client.get("/program", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_etag_matches_accepts_encoded_and_weak_tags():
+    assert etag_matches(encoded_etag(ETAG, "br"), ETAG)
+    assert etag_matches("W/" + encoded_etag(ETAG, "gzip"), ETAG)
+    assert not etag_matches('"other-gzip"', ETAG)
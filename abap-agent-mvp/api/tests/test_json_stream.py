@@ -0,0 +1,60 @@
+"""Tests for the streaming JSON formatter"""
+import json
+import time
+
+import pytest
+
+from config import settings
+from json_stream import JsonStreamError, iter_pretty_json
+from utils import SpecParseError, extract_text_from_json
+
+SPEC = {"ricef_type": "Report", "report_details": {"output_fields": [{"field_name": "MATNR"}], "flags": [True, None]}}
+
+
+def pretty(data: bytes, **kwargs) -> str:
+    return "".join(iter_pretty_json(data, **kwargs))
+
+
+def test_matches_json_dumps():
+    assert pretty(json.dumps(SPEC).encode()) == json.dumps(SPEC, indent=2)
+
+
+@pytest.mark.parametrize("suffix", [b"\n", b"\r\n", b"  \t\n\n"])
+def test_trailing_whitespace_is_allowed(suffix):
+    assert pretty(json.dumps(SPEC).encode() + suffix) == json.dumps(SPEC, indent=2)
+
+
+def test_stream_path_accepts_editor_saved_file(monkeypatch):
+    monkeypatch.setattr(settings, "json_stream_threshold", 10)
+    assert extract_text_from_json(b'{"ricef_type": "Report"}\n') == '{\n  "ricef_type": "Report"\n}'
+
+
+def test_small_chunks_concatenate_to_same_output():
+    data = json.dumps(SPEC).encode()
+    assert pretty(data, chunk_size=1) == json.dumps(SPEC, indent=2)
+
+
+@pytest.mark.parametrize("data", [b'{"a": 1} x', b'{"a": 1}}', b'{"a" 1}', b'[1, 2', b"", b"\n"])
+def test_invalid_documents_raise(data):
+    with pytest.raises(JsonStreamError):
+        pretty(data)
+
+
+def test_depth_and_size_limits():
+    with pytest.raises(JsonStreamError):
+        pretty(b"[" * 5 + b"]" * 5, max_depth=4)
+    with pytest.raises(JsonStreamError):
+        pretty(json.dumps(["x" * 100] * 10).encode(), max_output=200, chunk_size=16)
+
+
+def test_unterminated_string_fails_fast():
+    started = time.perf_counter()
+    with pytest.raises(JsonStreamError):
+        pretty(b'{"a": "' + b"x" * 100_000)
+    assert time.perf_counter() - started < 1
+
+
+def test_stream_path_reports_parse_error(monkeypatch):
+    monkeypatch.setattr(settings, "json_stream_threshold", 1)
+    with pytest.raises(SpecParseError):
+        extract_text_from_json(b'{"ricef_type": }')
@@ -0,0 +1,186 @@
+"""Tests for splitting oversized specs and merging the generated parts"""
+import asyncio
+import json
+
+from config import settings
+from map_reduce import (
+    SpecPart,
+    generate_map_reduce,
+    merge_part_programs,
+    partition_json_spec,
+    partition_tables,
+)
+
+
+def report_spec(fields: int, change_log: int = 0):
+    return {
+        "ricef_type": "report",
+        "report_details": {
+            "program_name": "ZMAT_REPORT",
+            "output_fields": [
+                {"field_name": f"FIELD{i:03}", "description": "Material attribute " * 3}
+                for i in range(fields)
+            ],
+        },
+        "change_log": [{"version": i, "note": "x" * 200} for i in range(change_log)],
+    }
+
+
+def test_small_spec_is_not_split_whatever_its_item_count():
+    spec = report_spec(fields=300)
+    assert partition_json_spec(spec, budget=len(json.dumps(spec)) + 1, max_parts=8) == []
+
+
+def test_large_spec_is_split_along_known_section():
+    spec = report_spec(fields=300, change_log=400)
+    parts = partition_json_spec(spec, budget=40000, max_parts=8)
+    assert len(parts) > 1
+    assert all(part.label.startswith("report_details.output_fields items") for part in parts)
+    fields = [f for part in parts for f in json.loads(part.content)["report_details"]["output_fields"]]
+    assert fields == spec["report_details"]["output_fields"]
+    assert all(len(json.loads(part.content)["change_log"]) == 400 for part in parts)
+
+
+def test_spec_without_known_section_is_not_split():
+    spec = {"ricef_type": "report", "change_log": [{"note": "x" * 200} for _ in range(500)]}
+    assert partition_json_spec(spec, budget=1000, max_parts=8) == []
+
+
+def test_part_count_is_capped():
+    spec = report_spec(fields=1000)
+    assert len(partition_json_spec(spec, budget=1000, max_parts=4)) == 4
+
+
+def test_tables_are_grouped_up_to_budget():
+    tables = [(f"Sheet{i}", "| a |\n" * 100) for i in range(10)]
+    parts = partition_tables(tables, budget=1500, max_parts=8)
+    assert 1 < len(parts) <= 8
+    assert sum(part.content.count("## Sheet") for part in parts) == 10
+
+
+def test_merge_keeps_shared_declarations_once():
+    parts = [SpecPart(label="items 1-2", content=""), SpecPart(label="items 3-4", content="")]
+    contents = [
+        "Here is part 1:\n```abap\nREPORT zmat.\nTABLES mara.\nDATA gv_total TYPE i.\n"
+        "START-OF-SELECTION.\n  gv_total = 1.\n```",
+        "```abap\nREPORT zmat_part2.\nTABLES mara.\nDATA gv_total TYPE i.\nDATA gv_count TYPE i.\n"
+        "START-OF-SELECTION.\n  gv_count = gv_total.\n```",
+    ]
+    program = merge_part_programs(parts, contents)
+    assert program.count("REPORT") == 1 and "REPORT zmat." in program
+    assert program.count("TABLES mara.") == 1
+    assert program.count("DATA gv_total TYPE i.") == 1
+    assert program.index("DATA gv_count") < program.index("START-OF-SELECTION")
+    assert program.index("gv_total = 1.") < program.index("gv_count = gv_total.")
+
+
+PART_1 = """```abap
+REPORT zmat.
+TYPES: BEGIN OF ty_out,
+         matnr TYPE mara-matnr,
+       END OF ty_out.
+DATA gt_out TYPE STANDARD TABLE OF ty_out.
+
+START-OF-SELECTION.
+  PERFORM get_data.
+  PERFORM show.
+
+FORM get_data.
+  SELECT matnr FROM mara INTO TABLE gt_out.
+ENDFORM.
+
+FORM show.
+  cl_demo_output=>display( gt_out ).
+ENDFORM.
+```"""
+
+PART_2 = """```abap
+REPORT zmat.
+TYPES: BEGIN OF ty_out,
+         matnr TYPE mara-matnr,
+         mtart TYPE mara-mtart,
+       END OF ty_out.
+DATA gt_out TYPE STANDARD TABLE OF ty_out.
+
+START-OF-SELECTION.
+  PERFORM get_data.
+  PERFORM show.
+
+FORM get_data.
+  SELECT matnr mtart FROM mara INTO TABLE gt_out.
+ENDFORM.
+
+FORM show.
+  cl_demo_output=>display( gt_out ).
+ENDFORM.
+```"""
+
+
+def test_merge_prefixes_clashing_routines_and_their_declarations():
+    parts = [SpecPart(label="items 1-2", content=""), SpecPart(label="items 3-4", content="")]
+    program = merge_part_programs(parts, [PART_1, PART_2])
+
+    # Same routine name, different body: part 2 gets its own copy and calls it
+    assert program.count("\nFORM get_data.") == 1
+    assert program.count("\nFORM p2_get_data.") == 1
+    assert "PERFORM p2_get_data." in program
+    # Its differing type and the table typed with it are renamed together
+    assert "END OF p2_ty_out." in program
+    assert "DATA p2_gt_out TYPE STANDARD TABLE OF p2_ty_out." in program
+    assert "SELECT matnr mtart FROM mara INTO TABLE p2_gt_out." in program
+    assert "SELECT matnr FROM mara INTO TABLE gt_out." in program
+    # show differs only through the renamed table
+    assert "FORM p2_show." in program and "display( p2_gt_out )" in program
+
+
+def test_merge_keeps_identical_routines_once():
+    parts = [SpecPart(label="a", content=""), SpecPart(label="b", content="")]
+    routine = "FORM log USING iv_text TYPE string.\n  WRITE / iv_text.\nENDFORM."
+    contents = [
+        f"```abap\nREPORT zlog.\nSTART-OF-SELECTION.\n  PERFORM log USING 'a'.\n{routine}\n```",
+        f"```abap\nREPORT zlog.\nSTART-OF-SELECTION.\n  PERFORM log USING 'b'.\n{routine}\n```",
+    ]
+    program = merge_part_programs(parts, contents)
+    assert program.count("\nFORM log USING") == 1
+    assert "PERFORM log USING 'b'." in program
+
+
+class FakeAssistantClient:
+    def __init__(self, consolidation_error=None):
+        self.consolidation_error = consolidation_error
+        self.messages = []
+        self.runs = []
+
+    async def create_thread(self):
+        return f"thread_part{len(self.runs) + 1}"
+
+    async def add_message(self, thread_id, content, metadata=None, role="user"):
+        self.messages.append((thread_id, role, content))
+        return f"msg_{len(self.messages)}"
+
+    async def run_assistant(self, thread_id, ricef_type=None, max_wait=60):
+        self.runs.append((thread_id, max_wait))
+        if thread_id == "thread_main":
+            if self.consolidation_error:
+                raise self.consolidation_error
+            return {"message_id": "msg_final", "content": "REPORT zfinal.", "role": "assistant", "thread_tokens": 10}
+        return {"content": PART_1 if len(self.runs) == 1 else PART_2}
+
+
+PARTS = [SpecPart(label="items 1-2", content="{}"), SpecPart(label="items 3-4", content="{}")]
+
+
+def test_consolidation_run_gets_merged_program_and_longer_poll_budget():
+    client = FakeAssistantClient()
+    result = asyncio.run(generate_map_reduce(client, "thread_main", "Generate", "spec.json", PARTS))
+    assert result["content"] == "REPORT zfinal."
+    assert client.runs[-1] == ("thread_main", settings.map_reduce_merge_timeout)
+    merge_prompt = client.messages[-1][2]
+    assert "FORM p2_get_data." in merge_prompt
+
+
+def test_failed_consolidation_answers_with_merged_program():
+    client = FakeAssistantClient(consolidation_error=Exception("Assistant response timeout"))
+    result = asyncio.run(generate_map_reduce(client, "thread_main", "Generate", "spec.json", PARTS))
+    assert "FORM p2_get_data." in result["content"]
+    assert client.messages[-1][:2] == ("thread_main", "assistant")
@@ -0,0 +1,132 @@
+"""Tests for relaying streamed n8n webhook responses"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main_n8n
+import n8n_client
+from n8n_client import N8nWorkflowClient
+
+client = N8nWorkflowClient()
+
+
+class FakeResponse:
+    """Just enough of httpx.Response for _relay_response"""
+
+    def __init__(self, body: bytes, chunk_size: int, content_type: str = "application/json"):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {"content-type": content_type}
+        self.encoding = "utf-8"
+
+    async def aiter_bytes(self):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+
+def relay(body: bytes, chunk_size: int, content_type: str = "application/json") -> str:
+    async def collect():
+        response = FakeResponse(body, chunk_size, content_type)
+        return "".join([chunk async for chunk in client._relay_response(response)])
+    return asyncio.run(collect())
+
+
+BODIES = [
+    {"content": "", "abap_code": "REPORT zreal."},
+    {"data": {"content": {"code": "X"}}, "abap_code": "REAL"},
+    {"abap_code": "   ", "code": "REPORT zcode."},
+    {"content": "REPORT zlater.", "abap_code": "REPORT zfirst."},
+    {"output": "REPORT zout.", "text": "ignored"},
+    {"data": {"abap_code": "NESTED"}},
+    [{"abap_code": "REPORT zitem.\n  WRITE 'ä €'."}, {"abap_code": "second"}],
+    [{"abap_code": ""}, {"abap_code": "second"}],
+    ["first", "second"],
+    [],
+    {"abap_code": "\\\"quoted\\\" 😀"},
+    {"abap_code": {"code": "X"}, "content": "Y"},
+    {"status": "ok"},
+]
+
+
+@pytest.mark.parametrize("body", BODIES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 4096])
+def test_stream_matches_extract_content(body, chunk_size):
+    data = json.dumps(body).encode()
+    assert relay(data, chunk_size) == client._extract_content(body)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3])
+def test_escapes_split_across_chunks(chunk_size):
+    body = {"abap_code": "a\\nb é 😀"}
+    data = json.dumps(body, ensure_ascii=True).encode()
+    assert relay(data, chunk_size) == body["abap_code"]
+
+
+def test_top_priority_value_streams_before_body_ends():
+    async def first_chunk():
+        response = FakeResponse(b'{"abap_code": "REPORT zfast.", "content": "', 4096)
+        return await client._relay_response(response).__anext__()
+    assert asyncio.run(first_chunk()) == "REPORT zfast."
+
+
+def test_non_json_is_passed_through():
+    assert relay(b"REPORT zplain.", 3, content_type="text/plain") == "REPORT zplain."
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """A webhook body that is cut off after its first chunk"""
+
+    async def __aiter__(self):
+        yield b"REPORT zpart."
+        raise httpx.ReadError("connection reset")
+
+
+def mock_webhook(monkeypatch, **response):
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, **response))
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        n8n_client.httpx, "AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs)
+    )
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "text/plain", "text/html"])
+@pytest.mark.parametrize("body", [b'{"abap_code": "REPORT zboth."}', b"REPORT zplain.", b'["a"]'])
+def test_buffered_and_streamed_paths_agree(monkeypatch, content_type, body):
+    mock_webhook(monkeypatch, content=body, headers={"content-type": content_type})
+
+    async def both():
+        buffered = await client.send_file_to_workflow(b"{}", "spec.json")
+        chunks = [chunk async for chunk in client.stream_file_to_workflow(b"{}", "spec.json")]
+        return buffered["content"], "".join(chunks)
+
+    buffered, streamed = asyncio.run(both())
+    assert buffered == streamed
+
+
+def stream_upload(monkeypatch, **response):
+    mock_webhook(monkeypatch, **response)
+    http = TestClient(main_n8n.app)
+    body = http.post("/api/upload/stream", files={"file": ("spec.txt", b"spec")}).text
+    content, _, trailer = body.rpartition(main_n8n.STREAM_TRAILER_SEPARATOR)
+    return content, json.loads(trailer)
+
+
+def test_stream_ends_with_a_success_trailer(monkeypatch):
+    content, trailer = stream_upload(
+        monkeypatch, content=b"REPORT zdone.", headers={"content-type": "text/plain"}
+    )
+    assert content == "REPORT zdone."
+    assert trailer["success"] is True
+    assert isinstance(trailer["validation_warnings"], list)
+
+
+def test_upstream_error_after_first_chunk_is_reported_in_the_trailer(monkeypatch):
+    content, trailer = stream_upload(
+        monkeypatch, stream=BrokenStream(), headers={"content-type": "text/plain"}
+    )
+    assert content == "REPORT zpart."
+    assert trailer["success"] is False
+    assert "connection reset" in trailer["error"]
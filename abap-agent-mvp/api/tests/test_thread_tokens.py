@@ -0,0 +1,51 @@
+"""Tests for the thread size recorded after assistant runs"""
+import asyncio
+from types import SimpleNamespace
+
+from openai_client import OpenAIAssistantClient
+from thread_compaction import ThreadCompactor
+
+
+def usage(total):
+    return SimpleNamespace(total_tokens=total)
+
+
+class FakeSteps:
+    def __init__(self, steps):
+        self.steps = steps
+        self.calls = 0
+
+    async def list(self, thread_id, run_id, order, limit):
+        self.calls += 1
+        return SimpleNamespace(data=self.steps[:limit])
+
+
+def client_with_steps(steps):
+    client = OpenAIAssistantClient()
+    fake_steps = FakeSteps(steps)
+    client.client = SimpleNamespace(
+        beta=SimpleNamespace(threads=SimpleNamespace(runs=SimpleNamespace(steps=fake_steps)))
+    )
+    return client, fake_steps
+
+
+RUN = SimpleNamespace(id="run_1", usage=usage(9000))
+
+
+def test_run_without_tools_uses_run_usage():
+    client, steps = client_with_steps([])
+    assert asyncio.run(client._thread_tokens("thread_1", RUN, tool_rounds=0)) == 9000
+    assert steps.calls == 0
+
+
+def test_run_with_tools_uses_last_step_usage():
+    # Three model calls of ~3000 tokens each: the thread is ~3000, not 9000
+    client, _ = client_with_steps([SimpleNamespace(usage=usage(3100)), SimpleNamespace(usage=usage(2900))])
+    assert asyncio.run(client._thread_tokens("thread_1", RUN, tool_rounds=2)) == 3100
+
+
+def test_unknown_size_is_forgotten():
+    compactor = ThreadCompactor(client=None, token_threshold=100, keep_messages=4)
+    compactor.record("thread_1", 500)
+    compactor.record("thread_1", None)
+    assert "thread_1" not in compactor._thread_tokens
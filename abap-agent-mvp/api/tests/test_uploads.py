@@ -0,0 +1,88 @@
+"""Tests for the shared upload checks"""
+import asyncio
+import io
+import threading
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import uploads
+from config import settings
+
+
+def read(content: bytes, filename: str = "spec.json", **kwargs):
+    return asyncio.run(uploads.read_upload(UploadFile(io.BytesIO(content), filename=filename), **kwargs))
+
+
+def test_validation_runs_off_the_event_loop(monkeypatch):
+    threads = []
+    validate = uploads.validate_upload
+
+    def recording_validate(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return validate(*args, **kwargs)
+
+    monkeypatch.setattr(uploads, "validate_upload", recording_validate)
+    monkeypatch.setattr(settings, "spec_validation_mode", "flag")
+    read(b'{"ricef_type": "report"}', extract_text=False)
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_rejected_spec_raises_422(monkeypatch):
+    monkeypatch.setattr(settings, "spec_validation_mode", "reject")
+    with pytest.raises(HTTPException) as error:
+        read(b"[]")
+    assert error.value.status_code == 422
+
+
+def test_flag_mode_returns_findings(monkeypatch):
+    monkeypatch.setattr(settings, "spec_validation_mode", "flag")
+    upload = read(b"[]")
+    assert upload.validation_warnings == ["Specification must be a JSON object"]
+    assert upload.text == "[]"
+
+
+def test_unparsable_json_raises_422():
+    with pytest.raises(HTTPException) as error:
+        read(b'{"ricef_type": }')
+    assert error.value.status_code == 422
+
+
+def test_disallowed_type_raises_400():
+    with pytest.raises(HTTPException) as error:
+        read(b"x", filename="spec.exe")
+    assert error.value.status_code == 400
+
+
+def test_json_is_parsed_once_for_validation_and_partitioning(monkeypatch):
+    import map_reduce
+    import spec_validation
+
+    def parse_again(file_content):
+        raise AssertionError("spec parsed a second time")
+
+    monkeypatch.setattr(spec_validation, "load_json", parse_again)
+    monkeypatch.setattr(map_reduce, "load_json", parse_again)
+    monkeypatch.setattr(settings, "spec_validation_mode", "flag")
+
+    upload = read(b'{"ricef_type": "report", "report_details": {"output_fields": [1, 2, 3]}}')
+    assert upload.spec["report_details"]["output_fields"] == [1, 2, 3]
+    map_reduce.partition_spec(upload.content, upload.filename, upload.spec)
+
+
+def test_large_spec_is_tokenized_or_parsed_never_both(monkeypatch):
+    import utils
+
+    monkeypatch.setattr(settings, "json_stream_threshold", 10)
+    monkeypatch.setattr(settings, "spec_validation_mode", "flag")
+    monkeypatch.setattr(utils, "iter_pretty_json", lambda *args, **kwargs: pytest.fail("tokenized"))
+    upload = read(b'{"ricef_type": "report", "report_details": {}}')
+    assert upload.spec["ricef_type"] == "report"
+
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "json_stream_threshold", 10)
+    monkeypatch.setattr(settings, "spec_validation_mode", "off")
+    monkeypatch.setattr(utils, "_parse_json", lambda *args: pytest.fail("parsed into objects"))
+    upload = read(b'{"ricef_type": "report"}')
+    assert upload.spec is None
+    assert upload.text == '{\n  "ricef_type": "report"\n}'
@@ -0,0 +1,57 @@
+"""Tests for spec parsing helpers"""
+import json
+
+import pytest
+
+from config import settings
+from utils import SpecParseError, extract_text_from_json, load_json, load_json_spec
+
+
+@pytest.mark.parametrize("document", [
+    b'{"doc_number": 18446744073709551617}',
+    b'{"doc_number": -123456789012345678901234567890}',
+    b'{"amount": 1e10, "ratio": 0.1}',
+    b'{"limit": NaN}',
+])
+def test_load_json_matches_stdlib(document):
+    assert repr(load_json(document)) == repr(json.loads(document))
+
+
+def test_big_integers_are_formatted_exactly():
+    text = extract_text_from_json(b'{"doc_number": 18446744073709551617}')
+    assert "18446744073709551617" in text
+
+
+def test_invalid_json_raises_spec_parse_error():
+    with pytest.raises(SpecParseError):
+        extract_text_from_json(b'{"doc_number": }')
+
+
+@pytest.mark.parametrize("document", [
+    b'{"a": {"b": {"c": 1}}}',
+    b'{"a": [[]]}',
+    b'[{"k\\"ey": {}}]',
+    b'{"a": {"b": {"c": 18446744073709551617}}}',
+])
+def test_tree_path_enforces_depth_limit(monkeypatch, document):
+    monkeypatch.setattr(settings, "json_max_depth", 2)
+    with pytest.raises(SpecParseError):
+        extract_text_from_json(document)
+    with pytest.raises(SpecParseError):
+        load_json_spec(document)
+
+
+def test_tree_path_allows_depth_limit(monkeypatch):
+    monkeypatch.setattr(settings, "json_max_depth", 2)
+    assert load_json_spec(b'{"a": {"b": "[{"}, "c": []}')[0]["c"] == []
+
+
+def test_deeply_nested_json_is_a_parse_error():
+    with pytest.raises(SpecParseError):
+        load_json_spec(b"[" * 100_000 + b"]" * 100_000)
+
+
+def test_tree_path_enforces_output_limit(monkeypatch):
+    monkeypatch.setattr(settings, "json_max_output_size", 50)
+    with pytest.raises(SpecParseError):
+        load_json_spec(json.dumps(["x" * 20] * 3).encode())
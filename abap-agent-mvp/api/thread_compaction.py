@@ -0,0 +1,171 @@
+"""
+Thread Compaction
+Keeps per-turn cost flat on long threads: once a thread crosses a token
+threshold, old turns are summarized into one memory message and the
+conversation continues on a new thread seeded with that memory and the
+most recent messages. Spec bodies already answered are replaced by references.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from metrics import registry
+from openai_client import OpenAIAssistantClient
+from profiling import stage
+
+# Message metadata "kind" values
+SPEC_KIND = "spec"
+MEMORY_KIND = "memory"
+
+CHARS_PER_TOKEN = 4  # rough estimate for English text and code
+SUMMARY_EXCERPT_CHARS = 4000  # longest excerpt of one message fed to the summarizer
+MESSAGES_PAGE = 100  # most messages one list call returns
+
+MEMORY_HEADER = "Summary of the earlier conversation (kept as memory, not a new request):\n\n"
+
+SUMMARY_INSTRUCTIONS = (
+    "You condense an ABAP development conversation into a compact memory. "
+    "Keep every decision, requirement, naming convention, SAP object "
+    "(tables, fields, function modules, classes) and open question. Name the "
+    "programs and specifications produced so far with a one-line description "
+    "each. Do not repeat generated code. Answer with the summary only."
+)
+
+compactions_counter = registry.counter(
+    "abap_thread_compactions_total", "Threads continued on a compacted successor"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def spec_metadata(filename: str, request: str) -> Dict[str, str]:
+    """Metadata marking a message that carries a pasted specification"""
+    # Metadata values are limited to 512 characters
+    return {"kind": SPEC_KIND, "filename": filename[:512], "request": (request or "")[:512]}
+
+
+def spec_reference(metadata: Dict[str, str]) -> str:
+    """Short stand-in for a specification message that was already processed"""
+    return (
+        f"{metadata.get('request', '')}\n\nFile: {metadata.get('filename', 'specification')}\n\n"
+        "[Specification content removed after it was processed. "
+        "The assistant reply that follows was generated from it.]"
+    )
+
+
+class ThreadCompactor:
+    """
+    Tracks how many tokens each thread costs per run and compacts threads
+    that cross `token_threshold` before the next message is added.
+    """
+
+    def __init__(
+        self,
+        client: OpenAIAssistantClient,
+        token_threshold: int,
+        keep_messages: int,
+        max_tracked_threads: int = 10000,
+    ):
+        self.client = client
+        self.token_threshold = token_threshold
+        self.keep_messages = max(1, keep_messages)
+        self.max_tracked_threads = max_tracked_threads
+        self._thread_tokens: "OrderedDict[str, int]" = OrderedDict()
+
+    def record(self, thread_id: str, tokens: Optional[int]) -> None:
+        """
+        Remember the token cost of a thread, usually the size reported by its
+        last run. None forgets it: the next check estimates it from the messages.
+        """
+        if tokens is None:
+            self._thread_tokens.pop(thread_id, None)
+            return
+        self._thread_tokens[thread_id] = tokens
+        self._thread_tokens.move_to_end(thread_id)
+        if len(self._thread_tokens) > self.max_tracked_threads:
+            self._thread_tokens.popitem(last=False)
+
+    async def thread_tokens(self, thread_id: str) -> int:
+        """Token cost of a thread; estimated from its messages when not tracked yet"""
+        tokens = self._thread_tokens.get(thread_id)
+        if tokens is None:
+            messages = await self.client.get_thread_messages(thread_id, MESSAGES_PAGE)
+            tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            self.record(thread_id, tokens)
+        return tokens
+
+    async def maybe_compact(self, thread_id: str) -> str:
+        """
+        Thread to continue the conversation on: thread_id itself, or a compacted
+        successor when the thread has grown past the threshold.
+        Compaction failures are logged and the original thread is kept.
+        """
+        if not settings.thread_compaction_enabled:
+            return thread_id
+        if await self.thread_tokens(thread_id) < self.token_threshold:
+            return thread_id
+        try:
+            with stage("thread_compaction"):
+                return await self.compact(thread_id)
+        except Exception as e:
+            print(f"[WARN] Thread compaction failed for {thread_id}: {e}")
+            return thread_id
+
+    async def compact(self, thread_id: str) -> str:
+        """Summarize old turns and rebuild the thread; returns the new thread ID"""
+        messages = await self.client.get_thread_messages(thread_id, MESSAGES_PAGE, order="desc")
+        messages = [message for message in reversed(messages) if message["content"].strip()]
+        old = messages[:-self.keep_messages]
+        recent = messages[-self.keep_messages:]
+
+        seed: List[Dict[str, Any]] = []
+        if old:
+            summary = await self.client.summarize(SUMMARY_INSTRUCTIONS, self._transcript(old))
+            seed.append({
+                "role": "user",
+                "content": MEMORY_HEADER + summary,
+                "metadata": {"kind": MEMORY_KIND},
+            })
+        for index, message in enumerate(recent):
+            answered = any(later["role"] == "assistant" for later in recent[index + 1:])
+            seed.append({
+                "role": message["role"],
+                "content": self._carried_content(message, answered),
+                "metadata": message["metadata"],
+            })
+        if not old and all(
+            entry["content"] == message["content"] for entry, message in zip(seed, recent)
+        ):
+            # Nothing to summarize or shorten, a rebuild would not help
+            return thread_id
+
+        new_thread_id = await self.client.create_thread(seed)
+        self._thread_tokens.pop(thread_id, None)
+        self.record(new_thread_id, sum(estimate_tokens(message["content"]) for message in seed))
+        compactions_counter.inc()
+        print(
+            f"[INFO] Compacted thread {thread_id} -> {new_thread_id} "
+            f"({len(old)} messages summarized, {len(recent)} kept)"
+        )
+        return new_thread_id
+
+    @staticmethod
+    def _carried_content(message: Dict[str, Any], answered: bool) -> str:
+        # A specification is only needed until the assistant has answered it
+        if answered and message["metadata"].get("kind") == SPEC_KIND:
+            return spec_reference(message["metadata"])
+        return message["content"]
+
+    @staticmethod
+    def _transcript(messages: List[Dict[str, Any]]) -> str:
+        """Conversation excerpt handed to the summarizer"""
+        entries = []
+        for message in messages:
+            content = message["content"]
+            if len(content) > SUMMARY_EXCERPT_CHARS:
+                content = content[:SUMMARY_EXCERPT_CHARS] + "\n[...]"
+            entries.append(f"{message['role'].upper()}:\n{content}")
+        return "\n\n".join(entries)
@@ -0,0 +1,113 @@
+"""
+Spec Uploads
+Type and size checks, text extraction and pre-validation of uploaded spec
+files, shared by every backend app. The CPU-bound work runs in one worker
+thread so large files never block the event loop.
+"""
+from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel
+from typing import Any, List, Optional
+import asyncio
+import os
+
+from config import settings
+from profiling import stage
+from spec_validation import SpecValidationReport, validate_upload
+from utils import SpecParseError, get_file_content_as_text, load_json_spec
+
+
+class SpecUpload(BaseModel):
+    """An uploaded spec that passed the checks"""
+
+    filename: str
+    content: bytes
+    text: Optional[str] = None  # extracted prompt text, when requested
+    spec: Any = None  # parsed JSON document, when validation or the caller needed it
+    validation_warnings: List[str] = []
+
+
+def prepare_spec(
+    file_content: bytes,
+    filename: str,
+    ricef_type: Optional[str] = None,
+    extract_text: bool = True,
+    keep_spec: bool = False,
+) -> SpecUpload:
+    """
+    Extract the prompt text and validate the spec. CPU-bound, call it from a
+    worker thread.
+    A JSON document needed by validation or by the caller (`keep_spec`, e.g.
+    for partitioning) is parsed once and its text dumped from the same tree.
+    Otherwise large documents are formatted from the token stream and never
+    held as objects.
+    Raises HTTPException (422) for unparsable or rejected specs.
+    """
+    text = None
+    spec = None
+    needs_document = keep_spec or settings.spec_validation_mode != "off"
+    if extract_text:
+        try:
+            if needs_document and os.path.splitext(filename)[1].lower() == ".json":
+                spec, text = load_json_spec(file_content)
+            else:
+                text = get_file_content_as_text(file_content, filename)
+        except SpecParseError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    validation_warnings: List[str] = []
+    if settings.spec_validation_mode != "off":
+        report = validate_upload(file_content, filename, text, ricef_type, spec)
+        validation_warnings = _validation_findings(report)
+    return SpecUpload(
+        filename=filename,
+        content=file_content,
+        text=text,
+        spec=spec,
+        validation_warnings=validation_warnings,
+    )
+
+
+def _validation_findings(report: SpecValidationReport) -> List[str]:
+    """Findings to return with the result, or a 422 in reject mode"""
+    if not report.valid and settings.spec_validation_mode == "reject":
+        raise HTTPException(
+            status_code=422,
+            detail=f"Specification failed validation: {'; '.join(report.errors)}",
+        )
+    return report.errors + report.warnings
+
+
+async def read_upload(
+    file: UploadFile,
+    ricef_type: Optional[str] = None,
+    extract_text: bool = True,
+    keep_spec: bool = False,
+) -> SpecUpload:
+    """
+    Check type and size of an uploaded file, then extract and validate it
+    off the event loop. Unusable specs are rejected before any generation.
+    `keep_spec` keeps the parsed JSON document on the result.
+    """
+    # Validate file type
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in settings.allowed_file_types:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File type {file_ext} not allowed. Allowed types: {settings.allowed_file_types}",
+        )
+
+    # Read file content
+    with stage("read"):
+        file_content = await file.read()
+
+    # Check file size
+    if len(file_content) > settings.max_file_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large. Max size: {settings.max_file_size} bytes",
+        )
+
+    with stage("parse_validate"):
+        return await asyncio.to_thread(
+            prepare_spec, file_content, file.filename, ricef_type, extract_text, keep_spec
+        )
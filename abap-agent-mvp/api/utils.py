@@ -1,6 +1,25 @@
 import openpyxl
 import io
 import json
+import re
+from typing import Any, List, Tuple
+
+from config import settings
+from json_stream import JsonStreamError, iter_pretty_json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib json module is the fallback
+    orjson = None
+
+# Integer literals beyond 64 bits: orjson turns them into floats, so such
+# documents (or strings that merely look like them) go through the stdlib
+_BIG_INTEGER = re.compile(rb"[0-9]{19,}")
+
+
+class SpecParseError(ValueError):
+    """Raised when an uploaded spec cannot be parsed"""
+
 
 def extract_text_from_xlsx(file_content: bytes) -> str:
     """
@@ -52,13 +71,154 @@ def extract_text_from_xlsx(file_content: bytes) -> str:
     except Exception as e:
         return f"Error parsing Excel file: {str(e)}"
 
+
+def extract_sheets_from_xlsx(file_content: bytes, max_rows: int) -> List[Tuple[str, str]]:
+    """
+    Extract every sheet of an Excel file as Markdown tables.
+    Sheets with more than max_rows data rows are split into several tables,
+    each repeating the header row. Returns (label, table) pairs.
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+    tables = []
+    for sheet in workbook.worksheets:
+        data_rows = []
+        for row in sheet.iter_rows(values_only=True):
+            row_vals = [
+                "" if val is None else str(val).replace("|", "\\|").replace("\n", " ").strip()
+                for val in row
+            ]
+            if any(row_vals):
+                data_rows.append(row_vals)
+        if not data_rows:
+            continue
+
+        headers, body = data_rows[0], data_rows[1:]
+        header_lines = [
+            "| " + " | ".join(headers) + " |",
+            "| " + " | ".join(["---"] * len(headers)) + " |",
+        ]
+        groups = [body[i:i + max_rows] for i in range(0, len(body), max_rows)] or [[]]
+        for index, group in enumerate(groups, start=1):
+            lines = list(header_lines)
+            for row in group:
+                row = (row + [""] * len(headers))[:len(headers)]
+                lines.append("| " + " | ".join(row) + " |")
+            label = sheet.title if len(groups) == 1 else f"{sheet.title} (rows {index} of {len(groups)})"
+            tables.append((label, "\n".join(lines)))
+    workbook.close()
+    return tables
+
+def _orjson_loads(file_content: bytes) -> Tuple[bool, Any]:
+    """
+    Parse with orjson when it gives the same result as the stdlib.
+    Returns (False, None) when the stdlib has to parse the document: orjson
+    is missing, an integer would lose precision, or orjson rejects the input
+    (the stdlib then reports the error, or accepts NaN/Infinity).
+    """
+    if orjson is None or _BIG_INTEGER.search(file_content):
+        return False, None
+    try:
+        return True, orjson.loads(file_content)
+    except orjson.JSONDecodeError:
+        return False, None
+
+
+def load_json(file_content: bytes) -> Any:
+    """Parse JSON bytes, using orjson when it is installed and exact"""
+    parsed, data = _orjson_loads(file_content)
+    if parsed:
+        return data
+    return json.loads(file_content)
+
+
 def extract_text_from_json(file_content: bytes) -> str:
-    """Format JSON content neatly"""
+    """
+    Format JSON content neatly.
+    Small documents are parsed and re-dumped; documents above
+    settings.json_stream_threshold are re-indented token by token so the
+    object tree is never built. Raises SpecParseError for invalid JSON.
+    """
+    if len(file_content) > settings.json_stream_threshold:
+        return _format_json_stream(file_content)
+    return _format_json_tree(file_content)
+
+
+def load_json_spec(file_content: bytes) -> Tuple[Any, str]:
+    """
+    Parse a JSON spec once and dump its prompt text from the same tree, for
+    callers that need the document (validation, partitioning).
+    There is no token-stream path here whatever the size: the tree is built
+    anyway, and dumping it is cheaper than re-tokenizing the bytes. Callers
+    that only need the text use extract_text_from_json, which keeps large
+    documents out of memory. Raises SpecParseError for invalid JSON.
+    """
+    exact, data = _parse_json(file_content)
+    return data, _dump_json(exact, data)
+
+
+def _format_json_tree(file_content: bytes) -> str:
+    """Parse into objects and dump again - fastest for small documents"""
+    return _dump_json(*_parse_json(file_content))
+
+
+def _parse_json(file_content: bytes) -> Tuple[bool, Any]:
+    """(parsed by orjson, document); raises SpecParseError for invalid JSON"""
+    exact, data = _orjson_loads(file_content)
+    if exact:
+        return True, data
+    try:
+        return False, json.loads(file_content)
+    except ValueError as e:
+        raise SpecParseError(f"Error parsing JSON file: {str(e)}")
+    except RecursionError:
+        raise SpecParseError("Error parsing JSON file: JSON nesting too deep")
+
+
+def _dump_json(exact: bool, data: Any) -> str:
+    """
+    Indented text of a parsed document, held to the stream formatter's
+    limits: settings.json_max_depth and settings.json_max_output_size.
+    """
+    try:
+        if exact:
+            text = orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+        else:
+            # Not orjson.dumps: it rejects big integers and writes NaN as null
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+    except (RecursionError, TypeError):  # orjson raises a TypeError past 255 levels
+        raise SpecParseError("Error parsing JSON file: JSON nesting too deep")
+    if _too_deep(text, settings.json_max_depth):
+        raise SpecParseError(
+            f"Error parsing JSON file: JSON nesting deeper than {settings.json_max_depth} levels"
+        )
+    if len(text) > settings.json_max_output_size:
+        raise SpecParseError(
+            f"Error parsing JSON file: formatted JSON larger than {settings.json_max_output_size} bytes"
+        )
+    return text
+
+
+def _too_deep(text: str, max_depth: int) -> bool:
+    """
+    Whether indented JSON text opens a container below max_depth levels.
+    Strings never span lines, so a line indented 2 * max_depth that starts
+    a container (possibly after its key) is one level too deep; a regex
+    search is far cheaper than walking the object tree.
+    """
+    pattern = r'\n {%d}(?:"(?:[^"\\]++|\\.)*+": )?[\[{]' % (2 * max_depth)
+    return re.search(pattern, text) is not None
+
+
+def _format_json_stream(file_content: bytes) -> str:
+    """Re-indent token by token - bounded memory for large documents"""
     try:
-        data = json.loads(file_content)
-        return json.dumps(data, indent=2)
-    except Exception:
-        return file_content.decode('utf-8', errors='ignore')
+        return "".join(iter_pretty_json(
+            file_content,
+            max_depth=settings.json_max_depth,
+            max_output=settings.json_max_output_size,
+        ))
+    except JsonStreamError as e:
+        raise SpecParseError(f"Error parsing JSON file: {str(e)}")
 
 def extract_text_from_txt(file_content: bytes) -> str:
     """Decode text file content"""
@@ -97,7 +97,8 @@ const ChatSection = () => {
       if (!response.ok) throw new Error('Failed to get response');
 
       const data = await response.json();
-      if (!threadId) setThreadId(data.thread_id);
+      // The backend may move a long conversation to a compacted thread
+      if (data.thread_id !== threadId) setThreadId(data.thread_id);
       extractCodeBlocks(data.content);
 
       setMessages(prev => [...prev, {
@@ -27,6 +27,9 @@ const getApiUrl = () => {
 
 const API_URL = getApiUrl();
 
+// Ends the streamed content; a JSON trailer with the outcome follows it
+const STREAM_TRAILER_SEPARATOR = '\u0000';
+
 const ChatSectionN8n = () => {
     const { addToast } = useToast();
     const [messages, setMessages] = useState([]);
@@ -94,7 +97,7 @@ const ChatSectionN8n = () => {
             const formData = new FormData();
             formData.append('file', uploadedFile);
 
-            const response = await fetch(`${API_URL}/api/upload`, {
+            const response = await fetch(`${API_URL}/api/upload/stream`, {
                 method: 'POST',
                 body: formData,
                 credentials: 'omit', // Explicitly omit cookies/credentials for wildcard CORS
@@ -105,23 +108,66 @@ const ChatSectionN8n = () => {
                 throw new Error(errorData.detail || 'Failed to get response from n8n workflow');
             }
 
-            const data = await response.json();
-
-            if (data.content) {
-                extractCodeBlocks(data.content);
-            }
-
-            setMessages(prev => [...prev, {
+            // Render the workflow output progressively as chunks arrive
+            const assistantMessage = {
                 role: 'assistant',
-                content: data.content || 'No response from workflow',
+                content: '',
                 timestamp: new Date().toLocaleTimeString(),
-                success: data.success,
+                success: true,
+            };
+            setMessages(prev => [...prev, assistantMessage]);
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let body = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                body += decoder.decode(value, { stream: true });
+                const partial = body.split(STREAM_TRAILER_SEPARATOR)[0];
+                setMessages(prev => [...prev.slice(0, -1), { ...assistantMessage, content: partial }]);
+            }
+            body += decoder.decode();
+
+            // A stream without a trailer was cut off before the workflow finished
+            const separatorIndex = body.lastIndexOf(STREAM_TRAILER_SEPARATOR);
+            const content = separatorIndex === -1 ? body : body.slice(0, separatorIndex);
+            let trailer = null;
+            if (separatorIndex !== -1) {
+                try {
+                    trailer = JSON.parse(body.slice(separatorIndex + 1));
+                } catch {
+                    trailer = null;
+                }
+            }
+            const streamError = !trailer
+                ? 'The n8n stream ended before the workflow finished'
+                : trailer.success ? null : (trailer.error || 'n8n workflow failed');
+
+            setMessages(prev => [...prev.slice(0, -1), {
+                ...assistantMessage,
+                content: content || 'No response from workflow',
+                success: !streamError,
             }]);
 
-            if (data.success) {
-                addToast({ message: 'n8n workflow completed!', type: 'success' });
+            if (content) {
+                extractCodeBlocks(content);
+            }
+
+            const warnings = trailer?.validation_warnings || [];
+            if (warnings.length > 0) {
+                addToast({ message: `Spec validation: ${warnings.join('; ')}`, type: 'info', duration: 8000 });
+            }
+
+            if (streamError) {
+                addToast({ message: `Error: ${streamError}`, type: 'error' });
+                setMessages(prev => [...prev, {
+                    role: 'error',
+                    content: `⚠️ The workflow output above is incomplete.\n\nError: ${streamError}`,
+                    timestamp: new Date().toLocaleTimeString(),
+                }]);
             } else {
-                addToast({ message: data.error || 'Workflow returned with issues', type: 'warning' });
+                addToast({ message: 'n8n workflow completed!', type: 'success' });
             }
         } catch (error) {
             addToast({ message: `Error: ${error.message}`, type: 'error' });